@@ -1,8 +1,33 @@
 import json
+import calendar
+import copy
+import cProfile
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
+import itertools
+import re
+import secrets
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 import os
+import queue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 import matplotlib.pyplot as plt
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict, deque
+from difflib import SequenceMatcher
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
@@ -10,6 +35,1166 @@ from tkcalendar import Calendar, DateEntry
 from PIL import Image, ImageTk
 import webbrowser
 
+FREQUENCIAS_RECORRENCIA = {
+    'mensal': 'Mensal',
+    'semanal': 'Semanal',
+    'dias': 'A cada N dias'
+}
+
+def avancar_data_recorrencia(regra, data):
+    """Calcula a ocorrência seguinte de uma regra recorrente a partir de uma data"""
+    intervalo = max(1, int(regra.get('intervalo', 1)))
+    
+    if regra['frequencia'] == 'mensal':
+        # Mantém o dia original do início, ajustando para meses mais curtos
+        dia_original = datetime.strptime(regra['inicio'], '%Y-%m-%d').day
+        mes = data.month - 1 + intervalo
+        ano = data.year + mes // 12
+        mes = mes % 12 + 1
+        dia = min(dia_original, calendar.monthrange(ano, mes)[1])
+        return data.replace(year=ano, month=mes, day=dia)
+    elif regra['frequencia'] == 'semanal':
+        return data + timedelta(weeks=intervalo)
+    return data + timedelta(days=intervalo)
+
+def ocorrencias_recorrencia(regra, ate, a_partir=None):
+    """Gera as datas das ocorrências de uma regra até a data informada (inclusive)"""
+    data = a_partir or datetime.strptime(regra['proxima'], '%Y-%m-%d')
+    fim = datetime.strptime(regra['fim'], '%Y-%m-%d') if regra.get('fim') else None
+    
+    while data <= ate and (fim is None or data <= fim):
+        yield data
+        data = avancar_data_recorrencia(regra, data)
+
+class Instrumentacao:
+    """Coleta tempos, contagem de chamadas e de linhas das ações da interface"""
+    
+    def __init__(self, max_amostras=1000, max_eventos=20000):
+        self.inicio = time.perf_counter()
+        self.tempos = defaultdict(lambda: deque(maxlen=max_amostras))  # Nome -> durações (s)
+        self.chamadas = defaultdict(int)
+        self.linhas = defaultdict(int)
+        self.eventos = deque(maxlen=max_eventos)  # Eventos no formato Chrome Trace
+        self.perfilador = None
+        self._pilha = threading.local()
+    
+    @contextmanager
+    def medir(self, nome):
+        """Mede o tempo de um bloco; use registrar_linhas() dentro dele"""
+        pilha = self._pilha.__dict__.setdefault('registros', [])
+        registro = {'linhas': 0}
+        pilha.append(registro)
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            duracao = time.perf_counter() - inicio
+            pilha.pop()
+            self.tempos[nome].append(duracao)
+            self.chamadas[nome] += 1
+            self.linhas[nome] += registro['linhas']
+            self.eventos.append({
+                'name': nome,
+                'ph': 'X',
+                'ts': round((inicio - self.inicio) * 1e6),
+                'dur': round(duracao * 1e6),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': {'linhas': registro['linhas']}
+            })
+    
+    def registrar_linhas(self, quantidade):
+        """Informa quantas linhas a ação em andamento processou"""
+        pilha = self._pilha.__dict__.get('registros')
+        if pilha:
+            pilha[-1]['linhas'] += quantidade
+    
+    @staticmethod
+    def percentil(valores, p):
+        ordenados = sorted(valores)
+        if not ordenados:
+            return 0
+        return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+    
+    def resumo(self):
+        """Lista (nome, chamadas, p50, p95, máximo, linhas) ordenada pelo tempo total"""
+        linhas = []
+        for nome, tempos in self.tempos.items():
+            linhas.append((
+                nome, self.chamadas[nome], self.percentil(tempos, 50),
+                self.percentil(tempos, 95), max(tempos), self.linhas[nome]
+            ))
+        return sorted(linhas, key=lambda x: x[1] * x[2], reverse=True)
+    
+    def iniciar_perfil(self):
+        """Liga a captura com cProfile (opcional, tem custo de desempenho)"""
+        if self.perfilador is None:
+            self.perfilador = cProfile.Profile()
+            self.perfilador.enable()
+    
+    def parar_perfil(self, caminho):
+        """Desliga a captura e grava as estatísticas no formato do pstats"""
+        if self.perfilador is not None:
+            self.perfilador.disable()
+            self.perfilador.dump_stats(caminho)
+            self.perfilador = None
+    
+    def exportar_trace(self, caminho):
+        """Grava os eventos para análise no chrome://tracing ou Perfetto"""
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': list(self.eventos), 'displayTimeUnit': 'ms'}, f)
+
+def instrumentado(funcao):
+    """Decorador que registra cada chamada do método em self.instrumentacao"""
+    @functools.wraps(funcao)
+    def wrapper(self, *args, **kwargs):
+        with self.instrumentacao.medir(funcao.__name__):
+            return funcao(self, *args, **kwargs)
+    return wrapper
+
+class TravaLeituraEscrita:
+    """Trava com vários leitores simultâneos e um escritor por vez.
+    
+    Escritores têm preferência: um escritor esperando impede novos leitores, de
+    modo que leituras contínuas da API não atrasam as gravações da interface. A
+    escrita é reentrante na mesma thread.
+    """
+    
+    def __init__(self):
+        self.condicao = threading.Condition()
+        self.leitores = 0
+        self.escritores_esperando = 0
+        self.dono = None
+        self.profundidade = 0
+    
+    @contextmanager
+    def leitura(self):
+        with self.condicao:
+            while self.dono is not None or self.escritores_esperando:
+                self.condicao.wait()
+            self.leitores += 1
+        try:
+            yield
+        finally:
+            with self.condicao:
+                self.leitores -= 1
+                if not self.leitores:
+                    self.condicao.notify_all()
+    
+    @contextmanager
+    def escrita(self):
+        eu = threading.get_ident()
+        with self.condicao:
+            if self.dono != eu:
+                self.escritores_esperando += 1
+                while self.dono is not None or self.leitores:
+                    self.condicao.wait()
+                self.escritores_esperando -= 1
+                self.dono = eu
+            self.profundidade += 1
+        try:
+            yield
+        finally:
+            with self.condicao:
+                self.profundidade -= 1
+                if not self.profundidade:
+                    self.dono = None
+                    self.condicao.notify_all()
+
+def com_escrita(funcao):
+    """Decorador que executa o método com a trava de escrita dos dados (self.trava_dados)"""
+    @functools.wraps(funcao)
+    def wrapper(self, *args, **kwargs):
+        with self.trava_dados.escrita():
+            return funcao(self, *args, **kwargs)
+    return wrapper
+
+def gravar_json_atomico(caminho, dados, **opcoes):
+    """Grava JSON num arquivo temporário e o troca pelo destino, sem nunca deixar um arquivo pela metade"""
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, **opcoes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+def assinatura_arquivo(caminho):
+    """Identifica a versão de um arquivo em disco (None se não existir)"""
+    try:
+        estado = os.stat(caminho)
+    except OSError:
+        return None
+    return (estado.st_mtime_ns, estado.st_size, estado.st_ino)
+
+def mesclar_tres_vias(base, local, externo, resumo=None):
+    """Mescla dois dicionários alterados a partir de uma base comum.
+    
+    Vale a alteração de quem mudou a chave; se os dois mudaram de forma
+    diferente, fica a versão local e a chave é informada como conflito.
+    Com resumo, a base guarda só resumo(valor) de cada chave (um hash, por
+    exemplo): basta saber se cada lado ainda é igual à base.
+    Devolve (resultado, conflitos).
+    """
+    resultado = {}
+    conflitos = []
+    for chave in set(base) | set(local) | set(externo):
+        b, l, e = base.get(chave), local.get(chave), externo.get(chave)
+        if resumo:
+            resumo_l, resumo_e = (None if v is None else resumo(v) for v in (l, e))
+        else:
+            resumo_l, resumo_e = l, e
+        if l == e or resumo_e == b:
+            valor = l
+        elif resumo_l == b:
+            valor = e
+        else:
+            valor = l
+            conflitos.append(chave)
+        if valor is not None:
+            resultado[chave] = valor
+    return resultado, conflitos
+
+def resumo_lancamento(lancamento):
+    """Hash do conteúdo de um lançamento, guardado como base da mesclagem no lugar de uma cópia"""
+    return hashlib.blake2b(json.dumps(lancamento, sort_keys=True).encode('utf-8'), digest_size=16).digest()
+
+_RE_LIMPEZA_VALOR = re.compile(r'[R$\s]')
+_RE_NUMERO_VALOR = re.compile(r'^([+-]?)(\d+(?:[.,]\d+)*)$')
+_RE_MILHAR_VALOR = re.compile(r'^\d{1,3}(?:\.\d{3})+$')
+
+@functools.lru_cache(maxsize=4096)
+def para_centavos(texto):
+    """Converte um valor digitado ('1.234,56', '12,5', '12.50', 'R$ 3') em centavos inteiros"""
+    correspondencia = _RE_NUMERO_VALOR.match(_RE_LIMPEZA_VALOR.sub('', str(texto)))
+    if not correspondencia:
+        raise ValueError(f"Valor inválido: {texto}")
+    sinal, corpo = correspondencia.groups()
+    
+    if ',' in corpo and '.' in corpo:
+        # O separador que aparece por último é o decimal
+        milhar = '.' if corpo.rfind(',') > corpo.rfind('.') else ','
+        corpo = corpo.replace(milhar, '').replace(',', '.')
+    elif ',' in corpo:
+        if corpo.count(',') > 1:
+            raise ValueError(f"Valor inválido: {texto}")
+        corpo = corpo.replace(',', '.')
+    elif '.' in corpo:
+        if _RE_MILHAR_VALOR.match(corpo):
+            corpo = corpo.replace('.', '')
+        elif corpo.count('.') > 1:
+            raise ValueError(f"Valor inválido: {texto}")
+    
+    try:
+        centavos = int((Decimal(corpo) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"Valor inválido: {texto}")
+    return -centavos if sinal == '-' else centavos
+
+def centavos_de_reais(valor):
+    """Converte um valor em reais (float de arquivos antigos) em centavos inteiros"""
+    return int((Decimal(repr(valor)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def reais_de_centavos(centavos):
+    """Texto decimal com ponto ('1234.56'), usado em CSV"""
+    return str(Decimal(centavos).scaleb(-2))
+
+@functools.lru_cache(maxsize=16384)
+def formatar_brl(centavos, simbolo=True, sinal=False):
+    """Formata centavos no padrão brasileiro: 'R$ 1.234,56'"""
+    reais, resto = divmod(abs(centavos), 100)
+    texto = f"{reais:,}".replace(',', '.') + f",{resto:02d}"
+    if simbolo:
+        texto = f"R$ {texto}"
+    if centavos < 0:
+        return '-' + texto
+    return '+' + texto if sinal else texto
+
+def converter_lancamentos_reais(lancamentos):
+    """Migra o campo 'valor' de reais (float) para centavos em lançamentos ou regras"""
+    for lancamento in lancamentos:
+        lancamento['valor'] = centavos_de_reais(lancamento['valor'])
+    return lancamentos
+
+def converter_resumo_reais(resumo):
+    """Migra para centavos os totais de metadados de partição ou de carteira"""
+    for chave in ('total', 'receitas'):
+        if chave in resumo:
+            resumo[chave] = centavos_de_reais(resumo[chave])
+    for chave in ('categorias', 'meses', 'tags'):
+        if chave in resumo:
+            resumo[chave] = {k: centavos_de_reais(v) for k, v in resumo[chave].items()}
+    if resumo.get('maior'):
+        resumo['maior']['valor'] = centavos_de_reais(resumo['maior']['valor'])
+    return resumo
+
+def e_receita(lancamento):
+    """Indica se o lançamento é uma receita (lançamentos antigos são despesas)"""
+    return lancamento.get('tipo', 'despesa') == 'receita'
+
+def partes_lancamento(lancamento):
+    """Pares (categoria, valor) do lançamento: as divisões, se houver, ou a categoria única"""
+    divisoes = lancamento.get('divisoes')
+    if divisoes:
+        return [(d['categoria'], d['valor']) for d in divisoes]
+    return [(lancamento['categoria'], lancamento['valor'])]
+
+def interpretar_tags(tags):
+    """Lista de tags sem repetições (ignorando maiúsculas), a partir de texto separado por vírgulas ou de uma lista"""
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    vistas = set()
+    resultado = []
+    for tag in tags:
+        tag = str(tag).strip()
+        if tag and tag.lower() not in vistas:
+            vistas.add(tag.lower())
+            resultado.append(tag)
+    return resultado
+
+def normalizar_divisoes(divisoes, total):
+    """Valida divisões [{'categoria', 'valor'}] em centavos: juntas, precisam somar o total do lançamento"""
+    por_categoria = OrderedDict()
+    for divisao in divisoes:
+        categoria = str(divisao.get('categoria', '')).strip()
+        valor = divisao.get('valor')
+        if not categoria or not isinstance(valor, int) or isinstance(valor, bool) or valor <= 0:
+            raise ValueError("Cada divisão precisa de categoria e valor positivo.")
+        por_categoria[categoria] = por_categoria.get(categoria, 0) + valor
+    if len(por_categoria) < 2:
+        raise ValueError("Uma divisão precisa de pelo menos duas categorias.")
+    soma = sum(por_categoria.values())
+    if soma != total:
+        raise ValueError(f"As divisões somam {formatar_brl(soma)}, mas o lançamento é de {formatar_brl(total)}.")
+    return [{'categoria': c, 'valor': v} for c, v in por_categoria.items()]
+
+def interpretar_divisoes(texto, total):
+    """Converte 'Alimentação: 30,00; Casa: 20,00' em divisões validadas (texto vazio = sem divisão)"""
+    divisoes = []
+    for parte in texto.split(';'):
+        if not parte.strip():
+            continue
+        categoria, separador, valor = parte.rpartition(':')
+        if not separador:
+            raise ValueError(f"Divisão inválida: '{parte.strip()}'. Use Categoria: valor; Categoria: valor.")
+        divisoes.append({'categoria': categoria, 'valor': para_centavos(valor)})
+    return normalizar_divisoes(divisoes, total) if divisoes else []
+
+def formatar_divisoes(divisoes):
+    """Texto editável das divisões, no formato aceito por interpretar_divisoes"""
+    return '; '.join(f"{d['categoria']}: {formatar_brl(d['valor'], simbolo=False)}" for d in divisoes or [])
+
+def classificar_lancamento(lancamento, tags, divisoes):
+    """Grava tags e divisões; com divisões, a categoria principal passa a ser a de maior valor"""
+    for campo, valor in (('tags', tags), ('divisoes', divisoes)):
+        if valor:
+            lancamento[campo] = valor
+        else:
+            lancamento.pop(campo, None)  # Campos vazios não são gravados
+    if divisoes:
+        lancamento['categoria'] = max(divisoes, key=lambda d: d['valor'])['categoria']
+
+class IndiceTags:
+    """Índice bitmap de tags: um inteiro por tag, com o bit de cada id ligado.
+    
+    Consultas com E/OU/NÃO entre tags viram operações &, | e ~ sobre inteiros,
+    feitas de uma vez para todos os lançamentos; o resultado é decodificado
+    uma única vez em um conjunto de ids (ids), e cada lançamento só testa
+    pertinência. As tags são comparadas sem diferenciar maiúsculas.
+    """
+    
+    def __init__(self):
+        self.bitmaps = {}  # Tag em minúsculas -> bits dos ids
+        self.nomes = {}  # Tag em minúsculas -> grafia exibida
+        self.todos = 0  # Bits de todos os ids indexados (universo do NÃO)
+        self.registros = {}  # Id -> tags incluídas
+    
+    def reconstruir(self, lancamentos):
+        # Junta os ids de cada tag antes: cada | sobre o inteiro grande o copiaria inteiro
+        ids_por_tag = defaultdict(list)
+        self.nomes = {}
+        self.registros = {}
+        for lancamento in lancamentos:
+            tags = [tag.lower() for tag in lancamento.get('tags', ())]
+            self.registros[lancamento['id']] = tags
+            for tag, nome in zip(tags, lancamento.get('tags', ())):
+                ids_por_tag[tag].append(lancamento['id'])
+                self.nomes.setdefault(tag, nome)
+        self.todos = self.bits(self.registros)
+        self.bitmaps = {tag: self.bits(ids) for tag, ids in ids_por_tag.items()}
+    
+    def adicionar(self, lancamento):
+        bit = 1 << lancamento['id']
+        self.todos |= bit
+        tags = [tag.lower() for tag in lancamento.get('tags', ())]
+        self.registros[lancamento['id']] = tags
+        for tag, nome in zip(tags, lancamento.get('tags', ())):
+            self.bitmaps[tag] = self.bitmaps.get(tag, 0) | bit
+            self.nomes.setdefault(tag, nome)
+    
+    def remover(self, lancamento):
+        tags = self.registros.pop(lancamento['id'], None)
+        if tags is None:
+            return
+        bit = 1 << lancamento['id']
+        self.todos &= ~bit
+        for tag in tags:
+            self.bitmaps[tag] &= ~bit
+            if not self.bitmaps[tag]:
+                del self.bitmaps[tag]
+                del self.nomes[tag]
+    
+    def consultar(self, todas=(), alguma=(), nenhuma=()):
+        """Bits dos ids com todas as tags de 'todas', ao menos uma de 'alguma' e nenhuma de 'nenhuma'"""
+        resultado = self.todos
+        for tag in todas:
+            resultado &= self.bitmaps.get(tag.lower(), 0)
+        if alguma:
+            uniao = 0
+            for tag in alguma:
+                uniao |= self.bitmaps.get(tag.lower(), 0)
+            resultado &= uniao
+        for tag in nenhuma:
+            resultado &= ~self.bitmaps.get(tag.lower(), 0)
+        return resultado
+    
+    @staticmethod
+    def bits(ids):
+        """Inteiro com o bit de cada id ligado, montado de uma só vez"""
+        ids = list(ids)
+        if not ids:
+            return 0
+        octetos = bytearray(max(ids) // 8 + 1)
+        for id_lancamento in ids:
+            octetos[id_lancamento >> 3] |= 1 << (id_lancamento & 7)
+        return int.from_bytes(octetos, 'little')
+    
+    @staticmethod
+    def ids(bits):
+        """Conjunto dos ids com bit ligado; decodificar uma vez evita deslocar o inteiro inteiro a cada teste"""
+        texto = bin(bits)[:1:-1]  # Bit menos significativo primeiro
+        ids = set()
+        posicao = texto.find('1')
+        while posicao != -1:
+            ids.add(posicao)
+            posicao = texto.find('1', posicao + 1)
+        return ids
+    
+    def quantidade(self, tag):
+        """Quantos lançamentos têm a tag"""
+        return bin(self.bitmaps.get(tag.lower(), 0)).count('1')
+    
+    def tags(self):
+        """Grafias exibidas de todas as tags em uso, em ordem alfabética"""
+        return sorted(self.nomes.values(), key=str.lower)
+
+class IndiceSaldo:
+    """Árvore de Fenwick (somas de prefixo) dos lançamentos por dia.
+    
+    Permite consultar o saldo em qualquer data e o fluxo de caixa de qualquer
+    intervalo em O(log n), inclusive após lançamentos retroativos.
+    """
+    
+    def __init__(self):
+        self.base = 0
+        self.arvore = [0]
+        self.por_dia = defaultdict(dict)  # Ordinal do dia -> {id: valor com sinal}
+    
+    @staticmethod
+    def dia(data):
+        """Converte 'AAAA-MM-DD ...', date ou datetime no ordinal do dia"""
+        if isinstance(data, str):
+            return datetime.strptime(data[:10], '%Y-%m-%d').toordinal()
+        return data.toordinal()
+    
+    @staticmethod
+    def valor_com_sinal(lancamento):
+        return lancamento['valor'] if e_receita(lancamento) else -lancamento['valor']
+    
+    def reconstruir(self, lancamentos):
+        """Monta o índice do zero em O(n)"""
+        self.por_dia = defaultdict(dict)
+        for lancamento in lancamentos:
+            self.por_dia[self.dia(lancamento['data'])][lancamento['id']] = self.valor_com_sinal(lancamento)
+        self._montar()
+    
+    def _montar(self):
+        """Recria a árvore cobrindo todos os dias, com folga de um ano em cada ponta"""
+        hoje = datetime.now().toordinal()
+        inicio = min(list(self.por_dia) + [hoje]) - 366
+        fim = max(list(self.por_dia) + [hoje]) + 366
+        
+        self.base = inicio
+        tamanho = fim - inicio + 1
+        arvore = [0] * (tamanho + 1)
+        for dia, itens in self.por_dia.items():
+            arvore[dia - inicio + 1] += sum(itens.values())
+        for i in range(1, tamanho + 1):
+            pai = i + (i & -i)
+            if pai <= tamanho:
+                arvore[pai] += arvore[i]
+        self.arvore = arvore
+    
+    def _somar(self, dia, delta):
+        i = dia - self.base + 1
+        if i < 1 or i >= len(self.arvore):
+            self._montar()  # Fora da faixa coberta: o valor já está em por_dia
+            return
+        while i < len(self.arvore):
+            self.arvore[i] += delta
+            i += i & -i
+    
+    def adicionar(self, lancamento):
+        dia = self.dia(lancamento['data'])
+        valor = self.valor_com_sinal(lancamento)
+        self.por_dia[dia][lancamento['id']] = valor
+        self._somar(dia, valor)
+    
+    def remover(self, lancamento):
+        dia = self.dia(lancamento['data'])
+        valor = self.por_dia[dia].pop(lancamento['id'], None)
+        if not self.por_dia[dia]:
+            del self.por_dia[dia]
+        if valor is not None:
+            self._somar(dia, -valor)
+    
+    def _prefixo(self, dia):
+        i = min(max(dia - self.base + 1, 0), len(self.arvore) - 1)
+        total = 0
+        while i > 0:
+            total += self.arvore[i]
+            i -= i & -i
+        return total
+    
+    def saldo_ate(self, data):
+        """Saldo acumulado até o fim do dia informado"""
+        return self._prefixo(self.dia(data))
+    
+    def fluxo(self, inicio, fim):
+        """Receitas menos despesas entre duas datas (inclusive)"""
+        return self._prefixo(self.dia(fim)) - self._prefixo(self.dia(inicio) - 1)
+    
+    def saldo_apos(self, lancamento):
+        """Saldo logo após o lançamento; no mesmo dia vale a ordem de cadastro (id)"""
+        dia = self.dia(lancamento['data'])
+        mesmo_dia = sum(v for i, v in self.por_dia.get(dia, {}).items() if i <= lancamento['id'])
+        return self._prefixo(dia - 1) + mesmo_dia
+
+class MotorAnalitico:
+    """Agregados mensais por categoria mantidos de forma incremental.
+    
+    A previsão de fim de mês combina o ritmo do mês corrente com a média móvel
+    exponencial (EWMA) dos meses anteriores; as anomalias usam o escore z robusto
+    (mediana e MAD) dos valores de cada categoria. Incluir ou remover um
+    lançamento custa O(log n) e invalida só as estatísticas da sua categoria.
+    """
+    
+    def __init__(self, alfa=0.3, meses_historico=12, minimo_amostras=8):
+        self.alfa = alfa
+        self.meses_historico = meses_historico
+        self.minimo_amostras = minimo_amostras
+        self.totais = defaultdict(int)  # (AAAA-MM, categoria) -> total de despesas
+        self.valores = defaultdict(list)  # Categoria -> valores das despesas, ordenados
+        self.registros = {}  # Id -> [(mês, categoria, valor)] do que foi incluído (uma parte por divisão)
+        self.estatisticas = {}  # Categoria -> (mediana, desvio) em cache
+        self.datas = []  # (data, id) das despesas, ordenado: janela recente sem varrer tudo
+        self.lancamentos = {}  # Id -> (data, lançamento) das despesas incluídas
+    
+    def reconstruir(self, lancamentos):
+        """Refaz os agregados a partir de uma lista de lançamentos"""
+        self.totais = defaultdict(int)
+        self.valores = defaultdict(list)
+        self.registros = {}
+        self.estatisticas = {}
+        self.lancamentos = {}
+        for lancamento in lancamentos:
+            if not e_receita(lancamento):
+                self.lancamentos[lancamento['id']] = (lancamento['data'], lancamento)
+                mes = lancamento['data'][:7]
+                partes = [(mes, categoria, valor) for categoria, valor in partes_lancamento(lancamento)]
+                self.registros[lancamento['id']] = partes
+                for _, categoria, valor in partes:
+                    self.totais[(mes, categoria)] += valor
+                    self.valores[categoria].append(valor)
+        for valores in self.valores.values():
+            valores.sort()
+        self.datas = sorted((data, id_lancamento) for id_lancamento, (data, _) in self.lancamentos.items())
+    
+    def adicionar(self, lancamento):
+        if e_receita(lancamento):
+            return
+        self.lancamentos[lancamento['id']] = (lancamento['data'], lancamento)
+        insort(self.datas, (lancamento['data'], lancamento['id']))
+        mes = lancamento['data'][:7]
+        partes = [(mes, categoria, valor) for categoria, valor in partes_lancamento(lancamento)]
+        self.registros[lancamento['id']] = partes
+        for _, categoria, valor in partes:
+            self.totais[(mes, categoria)] += valor
+            insort(self.valores[categoria], valor)
+            self.estatisticas.pop(categoria, None)
+    
+    def remover(self, lancamento):
+        partes = self.registros.pop(lancamento['id'], None)
+        if partes is None:
+            return
+        data, _ = self.lancamentos.pop(lancamento['id'])
+        del self.datas[bisect_left(self.datas, (data, lancamento['id']))]
+        for mes, categoria, valor in partes:
+            self.totais[(mes, categoria)] -= valor
+            if not self.totais[(mes, categoria)]:
+                del self.totais[(mes, categoria)]
+            valores = self.valores[categoria]
+            del valores[bisect_left(valores, valor)]
+            self.estatisticas.pop(categoria, None)
+    
+    @staticmethod
+    def mediana(valores_ordenados):
+        meio = len(valores_ordenados) // 2
+        if len(valores_ordenados) % 2:
+            return valores_ordenados[meio]
+        return (valores_ordenados[meio - 1] + valores_ordenados[meio]) / 2
+    
+    def meses_anteriores(self, hoje):
+        """Os meses_historico meses anteriores ao de hoje, do mais antigo ao mais recente"""
+        meses = []
+        ano, mes = hoje.year, hoje.month
+        for _ in range(self.meses_historico):
+            ano, mes = (ano - 1, 12) if mes == 1 else (ano, mes - 1)
+            meses.append(f"{ano:04d}-{mes:02d}")
+        return meses[::-1]
+    
+    def previsao(self, categoria, hoje):
+        """Projeção do total da categoria no fim do mês de hoje"""
+        acumulado = self.totais.get((hoje.strftime('%Y-%m'), categoria), 0)
+        historico = [self.totais.get((mes, categoria), 0) for mes in self.meses_anteriores(hoje)]
+        while historico and not historico[0]:
+            historico.pop(0)  # Meses antes do primeiro gasto da categoria não contam
+        
+        media = None
+        for total in historico:
+            media = total if media is None else self.alfa * total + (1 - self.alfa) * media
+        
+        # Quanto mais avançado o mês, mais peso tem o ritmo atual sobre o histórico
+        dias_mes = calendar.monthrange(hoje.year, hoje.month)[1]
+        fracao = hoje.day / dias_mes
+        ritmo = acumulado / fracao
+        previsto = ritmo if media is None else fracao * ritmo + (1 - fracao) * media
+        
+        return {
+            'acumulado': acumulado,
+            'media': None if media is None else round(media),
+            'previsto': max(round(previsto), acumulado)
+        }
+    
+    def previsoes(self, hoje):
+        """Previsões de todas as categorias com gastos no mês ou no histórico"""
+        meses = set(self.meses_anteriores(hoje)) | {hoje.strftime('%Y-%m')}
+        categorias = sorted({categoria for mes, categoria in self.totais if mes in meses})
+        return {categoria: self.previsao(categoria, hoje) for categoria in categorias}
+    
+    def dispersao(self, categoria):
+        """Mediana e desvio robusto (MAD) da categoria, ou None com poucas amostras"""
+        if categoria not in self.estatisticas:
+            valores = self.valores.get(categoria, [])
+            if len(valores) < self.minimo_amostras:
+                self.estatisticas[categoria] = None
+            else:
+                mediana = self.mediana(valores)
+                desvio = self.mediana(sorted(abs(v - mediana) for v in valores))
+                if not desvio:
+                    # Mais da metade dos valores iguais: usa o desvio absoluto médio
+                    desvio = 1.2533 * sum(abs(v - mediana) for v in valores) / len(valores)
+                self.estatisticas[categoria] = (mediana, desvio) if desvio else None
+        return self.estatisticas[categoria]
+    
+    def escore(self, lancamento):
+        """Escore z robusto do valor dentro da categoria (None se não houver base); com divisões, o da parte mais incomum"""
+        if e_receita(lancamento):
+            return None
+        escores = []
+        for categoria, valor in partes_lancamento(lancamento):
+            dispersao = self.dispersao(categoria)
+            if dispersao is not None:
+                mediana, desvio = dispersao
+                escores.append(0.6745 * (valor - mediana) / desvio)
+        return max(escores, default=None)
+    
+    def recentes(self, inicio):
+        """Despesas com data a partir de inicio ('AAAA-MM-DD'), por busca binária"""
+        return [self.lancamentos[i][1] for _, i in self.datas[bisect_left(self.datas, (inicio,)):]]
+    
+    def anomalias(self, lancamentos, limiar=3.5):
+        """Lançamentos com valor muito acima do normal da categoria, do mais extremo ao menos"""
+        encontrados = []
+        for lancamento in lancamentos:
+            escore = self.escore(lancamento)
+            if escore is not None and escore > limiar:
+                encontrados.append((lancamento, escore))
+        return sorted(encontrados, key=lambda x: x[1], reverse=True)
+
+DIMENSOES_RELATORIO = {
+    'ano': 'Ano',
+    'mes': 'Mês',
+    'dia_semana': 'Dia da Semana',
+    'categoria': 'Categoria',
+    'faixa': 'Faixa de Valor',
+    'tipo': 'Tipo'
+}
+DIAS_SEMANA = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
+FAIXAS_VALOR = [5000, 10000, 50000, 100000]  # Limites superiores das faixas, em centavos
+
+def rotulo_faixa(indice):
+    """Texto da faixa de valor de índice informado"""
+    if indice == 0:
+        return f"até {formatar_brl(FAIXAS_VALOR[0])}"
+    if indice == len(FAIXAS_VALOR):
+        return f"acima de {formatar_brl(FAIXAS_VALOR[-1])}"
+    return f"{formatar_brl(FAIXAS_VALOR[indice - 1])} a {formatar_brl(FAIXAS_VALOR[indice])}"
+
+class CuboLancamentos:
+    """Cubo OLAP com soma, quantidade e máximo por célula de todas as dimensões.
+    
+    As células base são mantidas de forma incremental; cada consulta agrega
+    (roll-up) essas células, ou um cubo mais detalhado já calculado, e fica em
+    cache até a próxima alteração. Trocar as dimensões do relatório não relê
+    os lançamentos. Um lançamento dividido entra uma vez em cada categoria,
+    com o valor da parte; a faixa de valor segue o total do lançamento.
+    Remover o máximo de uma célula só o marca como pendente; a próxima
+    consulta recalcula todos os pendentes numa única passada.
+    """
+    
+    DIMENSOES = tuple(DIMENSOES_RELATORIO)
+    
+    def __init__(self):
+        self.celulas = {}  # Chave com todas as dimensões -> [soma, quantidade, máximo]
+        self.registros = {}  # Id -> [(chave, valor)] do que foi incluído (uma parte por divisão)
+        self.cache = {}  # (dimensões, filtro) -> cubo agregado
+        self.maximos_pendentes = set()  # Chaves cujo máximo saiu e precisa ser recalculado
+    
+    @staticmethod
+    def chaves(lancamento):
+        """Pares (chave, valor) de cada parte do lançamento"""
+        # Fatiar a string evita strptime, que domina a reconstrução de partições recarregadas
+        ano, mes, dia = lancamento['data'][:4], lancamento['data'][5:7], lancamento['data'][8:10]
+        dia_semana = calendar.weekday(int(ano), int(mes), int(dia))
+        faixa = bisect_left(FAIXAS_VALOR, lancamento['valor'])
+        tipo = lancamento.get('tipo', 'despesa')
+        return [
+            ((ano, mes, dia_semana, categoria, faixa, tipo), valor)
+            for categoria, valor in partes_lancamento(lancamento)
+        ]
+    
+    def reconstruir(self, lancamentos):
+        self.celulas = {}
+        self.registros = {}
+        self.cache = {}
+        self.maximos_pendentes = set()
+        for lancamento in lancamentos:
+            self._incluir(lancamento)
+    
+    def _incluir(self, lancamento):
+        partes = self.chaves(lancamento)
+        self.registros[lancamento['id']] = partes
+        for chave, valor in partes:
+            celula = self.celulas.setdefault(chave, [0, 0, valor])
+            celula[0] += valor
+            celula[1] += 1
+            if celula[2] is not None:
+                celula[2] = max(celula[2], valor)
+    
+    def adicionar(self, lancamento):
+        self._incluir(lancamento)
+        self.cache = {}
+    
+    def remover(self, lancamento):
+        partes = self.registros.pop(lancamento['id'], None)
+        if partes is None:
+            return
+        for chave, valor in partes:
+            celula = self.celulas[chave]
+            celula[0] -= valor
+            celula[1] -= 1
+            if not celula[1]:
+                del self.celulas[chave]
+                self.maximos_pendentes.discard(chave)
+            elif valor == celula[2]:
+                # O máximo não se desfaz por subtração: fica pendente até a próxima consulta
+                celula[2] = None
+                self.maximos_pendentes.add(chave)
+        self.cache = {}
+    
+    def _recalcular_maximos(self):
+        """Recalcula numa só passada os máximos das células marcadas como pendentes"""
+        for partes in self.registros.values():
+            for chave, valor in partes:
+                if chave in self.maximos_pendentes:
+                    celula = self.celulas[chave]
+                    if celula[2] is None or valor > celula[2]:
+                        celula[2] = valor
+        self.maximos_pendentes = set()
+    
+    def consultar(self, dimensoes, filtro=None):
+        """Agrega o cubo nas dimensões pedidas, restrito ao filtro {dimensão: valor}"""
+        dimensoes = tuple(dimensoes)
+        filtro = tuple(sorted((filtro or {}).items()))
+        if (dimensoes, filtro) in self.cache:
+            return self.cache[(dimensoes, filtro)]
+        if self.maximos_pendentes:
+            self._recalcular_maximos()
+        
+        # Parte do menor cubo em cache que contenha as dimensões pedidas, ou das células base
+        origem_dimensoes, origem = self.DIMENSOES, self.celulas
+        for (dims, filt), cubo in list(self.cache.items()):
+            if filt == filtro and set(dimensoes) <= set(dims) and len(cubo) < len(origem):
+                origem_dimensoes, origem = dims, cubo
+        
+        posicoes = [origem_dimensoes.index(d) for d in dimensoes]
+        restricoes = [] if origem is not self.celulas else [(self.DIMENSOES.index(d), v) for d, v in filtro]
+        
+        resultado = {}
+        for chave, (soma, quantidade, maximo) in origem.items():
+            if any(chave[i] != v for i, v in restricoes):
+                continue
+            destino = tuple(chave[i] for i in posicoes)
+            celula = resultado.get(destino)
+            if celula is None:
+                resultado[destino] = [soma, quantidade, maximo]
+            else:
+                celula[0] += soma
+                celula[1] += quantidade
+                celula[2] = max(celula[2], maximo)
+        
+        self.cache[(dimensoes, filtro)] = resultado
+        return resultado
+
+class CacheImagens:
+    """Cache LRU de imagens decodificadas e gráficos renderizados, limitado em bytes"""
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.itens = OrderedDict()  # Chave -> (valor, tamanho em bytes)
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+    
+    def obter_ou_criar(self, chave, criar):
+        """Devolve o item em cache ou o cria com criar() -> (valor, tamanho em bytes)"""
+        if chave in self.itens:
+            self.itens.move_to_end(chave)
+            self.acertos += 1
+            return self.itens[chave][0]
+        
+        self.falhas += 1
+        valor, tamanho = criar()
+        self.itens[chave] = (valor, tamanho)
+        self.bytes += tamanho
+        # Descarta os menos usados, mas nunca o que acabou de entrar
+        while self.bytes > self.max_bytes and len(self.itens) > 1:
+            _, (_, tamanho_antigo) = self.itens.popitem(last=False)
+            self.bytes -= tamanho_antigo
+        return valor
+
+def versao_graficos(categorias, meses):
+    """Impressão digital dos dados de um gráfico: muda só quando os valores mudam"""
+    conteudo = json.dumps([sorted(categorias.items()), sorted(meses.items())], ensure_ascii=False)
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()[:16]
+
+def estimar_bytes(objeto, amostra=100, profundidade=4):
+    """Estimativa do tamanho de um objeto e do que ele contém.
+    
+    Coleções grandes são medidas por amostragem dos primeiros itens e
+    extrapoladas, para que a medição seja barata mesmo com milhões de registros.
+    Objetos compartilhados (como chaves de dicionário) podem ser contados mais
+    de uma vez: o valor é um limite superior aproximado.
+    """
+    tamanho = sys.getsizeof(objeto)
+    if profundidade == 0:
+        return tamanho
+    if isinstance(objeto, dict):
+        itens = [(k, v) for k, v in itertools.islice(objeto.items(), amostra)]
+    elif isinstance(objeto, (list, tuple, set, frozenset, deque)):
+        itens = list(itertools.islice(objeto, amostra))
+    else:
+        return tamanho
+    if not itens:
+        return tamanho
+    soma = sum(estimar_bytes(item, amostra, profundidade - 1) for item in itens)
+    return tamanho + soma * len(objeto) // len(itens)
+
+CABECALHO_EXPORTACAO = ['ID', 'Data', 'Valor', 'Categoria', 'Descrição', 'Tipo', 'Tags', 'Divisões']
+FORMATOS_EXPORTACAO = [
+    ("JSON File", "*.json"), ("JSON Lines", "*.jsonl"), ("CSV File", "*.csv"),
+    ("JSON (gzip)", "*.json.gz"), ("JSON Lines (gzip)", "*.jsonl.gz"), ("CSV (gzip)", "*.csv.gz"),
+    ("All Files", "*.*")
+]
+
+def abrir_arquivo_dados(caminho, modo, encoding='utf-8'):
+    """Abre um arquivo de texto, comprimido com gzip quando termina em .gz"""
+    if caminho.endswith('.gz'):
+        return gzip.open(caminho, modo + 't', encoding=encoding, newline='')
+    return open(caminho, modo, encoding=encoding, newline='')
+
+def formato_arquivo(caminho):
+    """Extensão que define o formato do arquivo, ignorando a compressão"""
+    return os.path.splitext(caminho[:-3] if caminho.endswith('.gz') else caminho)[1].lower()
+
+def gravar_exportacao(caminho, lancamentos, extras=None, tamanho_bloco=1000):
+    """Grava lançamentos em CSV, JSON Lines ou JSON de forma incremental.
+    
+    lancamentos pode ser qualquer iterável (inclusive um gerador): as linhas são
+    escritas em blocos de tamanho_bloco, sem montar o arquivo inteiro na memória.
+    extras são as chaves adicionais do JSON completo (limites, categorias...).
+    Devolve a quantidade de lançamentos gravados.
+    """
+    formato = formato_arquivo(caminho)
+    quantidade = 0
+    bloco = []
+    
+    # CSV com BOM para que o Excel reconheça a codificação
+    with abrir_arquivo_dados(caminho, 'w', encoding='utf-8-sig' if formato == '.csv' else 'utf-8') as f:
+        if formato == '.csv':
+            escritor = csv.writer(f, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+            escritor.writerow(CABECALHO_EXPORTACAO)
+            for g in lancamentos:
+                bloco.append([g['id'], g['data'][:10], reais_de_centavos(g['valor']),
+                              g['categoria'], g['descricao'], g.get('tipo', 'despesa'),
+                              ', '.join(g.get('tags', [])), formatar_divisoes(g.get('divisoes'))])
+                if len(bloco) >= tamanho_bloco:
+                    escritor.writerows(bloco)
+                    quantidade += len(bloco)
+                    bloco = []
+            escritor.writerows(bloco)
+        
+        elif formato == '.jsonl':
+            for g in lancamentos:
+                bloco.append(json.dumps(g, ensure_ascii=False))
+                if len(bloco) >= tamanho_bloco:
+                    f.write('\n'.join(bloco) + '\n')
+                    quantidade += len(bloco)
+                    bloco = []
+            if bloco:
+                f.write('\n'.join(bloco) + '\n')
+        
+        else:  # JSON completo: cabeçalho com os extras e a lista de gastos escrita aos poucos
+            cabecalho = dict(extras or {}, unidade='centavos')
+            f.write('{\n')
+            for chave, valor in cabecalho.items():
+                f.write(f'  {json.dumps(chave)}: {json.dumps(valor, ensure_ascii=False)},\n')
+            f.write('  "gastos": [')
+            separador = '\n    '
+            for g in lancamentos:
+                bloco.append(json.dumps(g, ensure_ascii=False))
+                if len(bloco) >= tamanho_bloco:
+                    f.write(separador + ',\n    '.join(bloco))
+                    separador = ',\n    '
+                    quantidade += len(bloco)
+                    bloco = []
+            if bloco:
+                f.write(separador + ',\n    '.join(bloco))
+            f.write('\n  ]\n}\n')
+    
+    return quantidade + len(bloco)
+
+def ler_arquivo_importacao(caminho):
+    """Lê um arquivo JSON, JSON Lines ou CSV e devolve lançamentos normalizados (valores em centavos, sem id)"""
+    novos_gastos = []
+    novos_limites = {}
+    novas_categorias = []
+    formato = formato_arquivo(caminho)
+    
+    if formato == '.json':
+        with abrir_arquivo_dados(caminho, 'r') as f:
+            dados = json.load(f)
+        
+        if isinstance(dados, dict):  # Formato novo
+            novos_gastos = dados.get('gastos', [])
+            novos_limites = dados.get('limites', {})
+            novas_categorias = dados.get('categorias', [])
+            if dados.get('unidade') != 'centavos':
+                converter_lancamentos_reais(novos_gastos)
+                novos_limites = {c: centavos_de_reais(v) for c, v in novos_limites.items()}
+        else:  # Formato antigo
+            novos_gastos = converter_lancamentos_reais(dados)
+    
+    elif formato == '.jsonl':
+        # JSON Lines é sempre gravado em centavos
+        with abrir_arquivo_dados(caminho, 'r') as f:
+            novos_gastos = [json.loads(linha) for linha in f if linha.strip()]
+    
+    elif formato == '.csv':
+        with abrir_arquivo_dados(caminho, 'r', encoding='utf-8-sig') as f:
+            leitor = csv.reader(f)
+            next(leitor, None)  # Pular cabeçalho
+            for campos in leitor:
+                if len(campos) >= 5:
+                    gasto = {
+                        'data': datetime.strptime(campos[1], '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S'),
+                        'valor': para_centavos(campos[2]),
+                        'categoria': campos[3],
+                        'descricao': campos[4],
+                        'tipo': 'receita' if len(campos) > 5 and campos[5] == 'receita' else 'despesa'
+                    }
+                    # Colunas de tags e divisões só existem em arquivos exportados por versões recentes
+                    classificar_lancamento(
+                        gasto, interpretar_tags(campos[6]) if len(campos) > 6 else [],
+                        interpretar_divisoes(campos[7], gasto['valor']) if len(campos) > 7 else []
+                    )
+                    novos_gastos.append(gasto)
+    
+    # Os ids de origem são descartados: cada lançamento recebe um id novo ao entrar na carteira
+    novos_gastos = [{k: v for k, v in g.items() if k != 'id'} for g in novos_gastos]
+    return {'gastos': novos_gastos, 'limites': novos_limites, 'categorias': novas_categorias}
+
+def normalizar_descricao(texto):
+    """Descrição sem acentos, pontuação, caixa ou espaços repetidos, para comparação"""
+    texto = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', texto).split())
+
+def impressao_digital(lancamento):
+    """Chave de duplicidade exata: data, valor, tipo e descrição normalizada"""
+    return (
+        lancamento['data'][:10], lancamento['valor'],
+        lancamento.get('tipo', 'despesa'), normalizar_descricao(lancamento.get('descricao', ''))
+    )
+
+def deduplicar_lancamentos(existentes, lotes, janela_dias=3, limiar_similaridade=0.85):
+    """Separa os lançamentos importados em novos, duplicados exatos e possíveis duplicados.
+    
+    lotes é uma lista de listas de lançamentos (um lote por arquivo), comparados
+    em ordem: os aceitos de um lote (novos e possíveis duplicados) entram no índice
+    antes do lote seguinte, para que extratos sobrepostos não dupliquem entre si.
+    Dentro do mesmo lote, lançamentos iguais são mantidos.
+    Duplicados exatos são encontrados por um índice de hash das impressões digitais
+    em O(n + m). Os possíveis duplicados usam blocagem por (valor, tipo, dia): só são
+    comparados lançamentos de mesmo valor a até janela_dias de distância.
+    """
+    indice = Counter()
+    blocos = defaultdict(list)
+    
+    def indexar(lancamentos):
+        for g in lancamentos:
+            indice[impressao_digital(g)] += 1
+            blocos[(g['valor'], g.get('tipo', 'despesa'), IndiceSaldo.dia(g['data']))].append(g)
+    
+    indexar(existentes)
+    relatorio = {'novos': [], 'duplicados': [], 'suspeitos': []}
+    for novos in lotes:
+        aceitos = []
+        for novo in novos:
+            chave = impressao_digital(novo)
+            if indice[chave] > 0:
+                indice[chave] -= 1  # Cada existente absorve no máximo um importado
+                relatorio['duplicados'].append(novo)
+                continue
+            
+            dia = IndiceSaldo.dia(novo['data'])
+            melhor = None
+            for vizinho in range(dia - janela_dias, dia + janela_dias + 1):
+                for existente in blocos.get((novo['valor'], chave[2], vizinho), ()):
+                    similaridade = SequenceMatcher(None, chave[3], normalizar_descricao(existente.get('descricao', ''))).ratio()
+                    if similaridade >= limiar_similaridade and (melhor is None or similaridade > melhor[1]):
+                        melhor = (existente, similaridade)
+            
+            if melhor:
+                relatorio['suspeitos'].append((novo, melhor[0], melhor[1]))
+            else:
+                relatorio['novos'].append(novo)
+            aceitos.append(novo)
+        indexar(aceitos)
+    return relatorio
+
+class ErroAPI(Exception):
+    """Erro de uma requisição da API, com o status HTTP a devolver"""
+    
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+class ManipuladorAPI(BaseHTTPRequestHandler):
+    """Traduz requisições HTTP/JSON em chamadas ao gerenciador (self.server.app).
+    
+    Só atende requisições com Host local e o token da sessão (self.server.token)
+    no cabeçalho Authorization; escritas exigem Content-Type application/json.
+    Assim uma página aberta no navegador não consegue ler nem alterar os dados,
+    nem por formulários simples nem por DNS rebinding.
+    """
+    
+    HOSTS_PERMITIDOS = ('127.0.0.1', 'localhost')
+    
+    def log_message(self, formato, *args):
+        pass  # Sem logs no console; os tempos ficam na instrumentação
+    
+    def responder(self, status, dados):
+        corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+    
+    def tratar(self, metodo):
+        url = urlparse(self.path)
+        partes = [p for p in url.path.split('/') if p]
+        parametros = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        app = self.server.app
+        
+        try:
+            # Host com outro nome (DNS rebinding) ou ausente é recusado
+            if urlparse('//' + (self.headers.get('Host') or '')).hostname not in self.HOSTS_PERMITIDOS:
+                raise ErroAPI(403, "Host não permitido")
+            autorizacao = self.headers.get('Authorization') or ''
+            if not hmac.compare_digest(autorizacao.encode('utf-8'), f"Bearer {self.server.token}".encode('utf-8')):
+                raise ErroAPI(401, "Token ausente ou inválido (Authorization: Bearer <token>)")
+            tipo_conteudo = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+            if metodo in ('POST', 'PUT') and tipo_conteudo != 'application/json':
+                raise ErroAPI(415, "Envie o corpo com Content-Type: application/json")
+            
+            corpo = {}
+            tamanho = int(self.headers.get('Content-Length') or 0)
+            if tamanho:
+                try:
+                    corpo = json.loads(self.rfile.read(tamanho).decode('utf-8'))
+                except ValueError:
+                    raise ErroAPI(400, "Corpo JSON inválido")
+            
+            with app.instrumentacao.medir(f"api {metodo} /{partes[0] if partes else ''}"):
+                rota = tuple(partes[:1]) + (('id',) if len(partes) == 2 else ())
+                if len(partes) == 2 and not partes[1].isdigit():
+                    raise ErroAPI(404, "Recurso não encontrado")
+                id_lancamento = int(partes[1]) if len(partes) == 2 else None
+                
+                if (metodo, rota) == ('GET', ('lancamentos',)):
+                    self.responder(200, app.api_listar(parametros))
+                elif (metodo, rota) == ('GET', ('lancamentos', 'id')):
+                    self.responder(200, app.api_obter(id_lancamento))
+                elif (metodo, rota) == ('POST', ('lancamentos',)):
+                    self.responder(201, app.executar_na_interface(app.api_adicionar, corpo))
+                elif (metodo, rota) == ('PUT', ('lancamentos', 'id')):
+                    self.responder(200, app.executar_na_interface(app.api_editar, id_lancamento, corpo))
+                elif (metodo, rota) == ('DELETE', ('lancamentos', 'id')):
+                    self.responder(200, app.executar_na_interface(app.api_remover, id_lancamento))
+                elif (metodo, rota) == ('GET', ('resumo',)):
+                    self.responder(200, app.api_resumo())
+                elif (metodo, rota) == ('GET', ('graficos',)):
+                    self.responder(200, app.api_graficos(parametros))
+                else:
+                    raise ErroAPI(404, "Recurso não encontrado")
+        except ErroAPI as e:
+            self.responder(e.status, {'erro': str(e)})
+        except Exception as e:
+            self.responder(500, {'erro': str(e)})
+    
+    def do_GET(self):
+        self.tratar('GET')
+    
+    def do_POST(self):
+        self.tratar('POST')
+    
+    def do_PUT(self):
+        self.tratar('PUT')
+    
+    def do_DELETE(self):
+        self.tratar('DELETE')
+
 class GerenciadorGastosGUI:
     def __init__(self, root):
         self.root = root
@@ -17,24 +1202,72 @@ class GerenciadorGastosGUI:
         self.root.geometry("1200x800")
         self.root.minsize(1000, 700)
         
+        self.instrumentacao = Instrumentacao()
+        
         # Configurações
         self.arquivo_dados = 'gastos.json'
+        self.arquivo_carteiras = 'carteiras.json'
+        self.carteiras_dir = 'carteiras'
         self.backup_dir = 'backups'
         self.theme = 'light'  # 'light' or 'dark'
-        self.gastos = []
+        self.intervalo_recorrencias_ms = 60 * 60 * 1000  # Verifica recorrências a cada hora
+        self.intervalo_verificacao_arquivos_ms = 2000  # Detecta alterações externas nos arquivos
+        self.assinaturas_arquivos = {}  # Caminho -> versão do arquivo na última leitura/gravação
+        self.bases_arquivos = {}  # Caminho -> base da mesclagem de alterações externas (partições: id -> hash)
+        self.arquivos_ilegiveis = []  # Arquivos alterados por fora que não puderam ser lidos na última verificação
+        self.dias_projecao = 60  # Horizonte dos lançamentos previstos
+        self.tempo_ociosidade_carteira = 10 * 60  # Segundos até liberar uma carteira inativa da memória
+        self.max_carteiras_em_memoria = 3
+        self.orcamento_memoria_mb = 0  # Modo de memória limitada (0 = sem limite)
+        self.max_linhas_tabela = 5000  # Linhas exibidas na tabela no modo de memória limitada
+        self.acesso_particoes = {}  # Ano -> último uso da partição, para descartar as mais frias
+        self.particoes_reservadas = Counter()  # Ano -> consumidores (API, relatórios) que ainda o usam
+        self.trava_reservas = threading.Lock()  # Reservas vêm de threads da API e são lidas na interface
+        self.janela_duplicados_dias = 3  # Distância máxima entre possíveis duplicados na importação
+        self.limiar_similaridade = 0.85  # Semelhança mínima das descrições (0 a 1)
+        self.max_processos_importacao = os.cpu_count() or 1
+        self.importacao_em_andamento = None
+        self.trava_dados = TravaLeituraEscrita()  # Protege os dados lidos pela API em outras threads
+        self.fila_interface = queue.Queue()  # Operações da API a executar na thread da interface
+        self.servidor_api = None
+        self.endereco_api = ('127.0.0.1', 8765)
+        self.lancamentos_exibidos = None  # Lançamentos da visualização filtrada (None = lista completa)
+        self.gastos = []  # Apenas os lançamentos das partições carregadas
+        self.particoes = {}  # Ano -> metadados da partição (totais, categorias, meses)
+        self.particoes_carregadas = set()
+        self.particoes_alteradas = set()
+        self.indice_saldo = IndiceSaldo()
+        self.motor_analitico = MotorAnalitico()
+        self.cache_imagens = CacheImagens()
+        self.tamanho_graficos = (10, 8)  # Polegadas
+        self.dpi_exportacao = 300
+        self.graficos_exibidos = None  # (período, categorias, meses) do gráfico na tela
+        self.cubo_lancamentos = CuboLancamentos()
+        self.indice_tags = IndiceTags()
+        self.limiar_anomalia = 3.5  # Escore z robusto a partir do qual um gasto é incomum
+        self.dias_anomalias = 90  # Janela de lançamentos verificados na aba de previsão
+        self.recorrencias = []
         self.limites_categoria = {}
-        self.categorias_predefinidas = [
+        self.categorias_padrao = [
             'Alimentação', 'Transporte', 'Moradia', 'Lazer', 
             'Saúde', 'Educação', 'Vestuário', 'Outros'
         ]
+        self.categorias_predefinidas = list(self.categorias_padrao)
+        self.carteiras = {}
+        self.carteira_ativa = 'Pessoal'
+        self.carteiras_abertas = {}  # Carteiras inativas mantidas em memória para troca rápida
         
         # Carregar dados e configurar interface
         self.criar_diretorio_backup()
+        self.carregar_carteiras()
         self.carregar_dados()
         self.configurar_estilos()
         self.criar_widgets()
         self.atualizar_lista_gastos()
         self.criar_menu()
+        self.processar_recorrencias()
+        self.root.after(60 * 1000, self.liberar_carteiras_ociosas)
+        self.root.after(self.intervalo_verificacao_arquivos_ms, self.verificar_alteracoes_externas)
     
     def configurar_estilos(self):
         """Configura os estilos visuais da aplicação"""
@@ -69,53 +1302,282 @@ class GerenciadorGastosGUI:
         if not os.path.exists(self.backup_dir):
             os.makedirs(self.backup_dir)
     
+    @instrumentado
+    @com_escrita
     def carregar_dados(self):
         """Carrega os dados do arquivo JSON com tratamento de erros"""
         if os.path.exists(self.arquivo_dados):
             try:
+                assinatura = assinatura_arquivo(self.arquivo_dados)
                 with open(self.arquivo_dados, 'r', encoding='utf-8') as f:
                     dados = json.load(f)
                     
                     if isinstance(dados, list):  # Formato antigo
-                        self.gastos = [{'id': i+1, **gasto} for i, gasto in enumerate(dados)]
+                        self.gastos = converter_lancamentos_reais([{'id': i+1, **gasto} for i, gasto in enumerate(dados)])
                         self.limites_categoria = {}
+                        self.particoes_carregadas = {g['data'][:4] for g in self.gastos}
+                        self.particoes_alteradas = set(self.particoes_carregadas)
                         self.salvar_dados()
                     elif isinstance(dados, dict):  # Formato novo
-                        self.gastos = dados.get('gastos', [])
-                        for i, gasto in enumerate(self.gastos):
-                            if 'id' not in gasto:
-                                gasto['id'] = i + 1
+                        if dados.get('unidade') != 'centavos':  # Valores antigos em reais (float)
+                            dados['limites'] = {c: centavos_de_reais(v) for c, v in dados.get('limites', {}).items()}
+                            converter_lancamentos_reais(dados.get('recorrencias', []))
+                            converter_lancamentos_reais(dados.get('gastos', []))
+                            for meta in dados.get('particoes', {}).values():
+                                converter_resumo_reais(meta)
+                        
                         self.limites_categoria = dados.get('limites', {})
                         self.categorias_predefinidas = dados.get('categorias', self.categorias_predefinidas)
+                        self.recorrencias = dados.get('recorrencias', [])
+                        
+                        if 'gastos' in dados:  # Ainda sem particionamento: migra no próximo salvamento
+                            self.gastos = dados['gastos']
+                            for i, gasto in enumerate(self.gastos):
+                                if 'id' not in gasto:
+                                    gasto['id'] = i + 1
+                            self.particoes = {}
+                            self.particoes_carregadas = {g['data'][:4] for g in self.gastos}
+                            self.particoes_alteradas = set(self.particoes_carregadas)
+                            self.salvar_dados()
+                        else:
+                            # Apenas os anos do mês atual e do anterior são lidos agora
+                            self.particoes = dados.get('particoes', {})
+                            self.registrar_versao_principal(assinatura)
+                            hoje = datetime.now()
+                            mes_passado = hoje.replace(day=1) - timedelta(days=1)
+                            self.garantir_particoes({hoje.strftime('%Y'), mes_passado.strftime('%Y')})
                         
             except Exception as e:
                 messagebox.showerror("Erro", f"Erro ao carregar dados: {str(e)}")
                 if messagebox.askyesno("Recuperação", "Deseja restaurar do último backup?"):
                     self.restaurar_backup()
+        
+        self.indice_saldo.reconstruir(self.gastos)
+        self.motor_analitico.reconstruir(self.gastos)
+        self.cubo_lancamentos.reconstruir(self.gastos)
+        self.indice_tags.reconstruir(self.gastos)
+        self.instrumentacao.registrar_linhas(len(self.gastos))
+    
+    def caminho_particao(self, ano):
+        """Retorna o arquivo da partição anual da carteira ativa"""
+        return os.path.join(f"{os.path.splitext(self.arquivo_dados)[0]}_particoes", f'{ano}.json')
+    
+    @instrumentado
+    @com_escrita
+    def garantir_particoes(self, anos=None):
+        """Carrega sob demanda as partições anuais ainda fora da memória (None = todas)"""
+        if anos is None:
+            anos = set(self.particoes)
+        agora = time.time()
+        for ano in anos:
+            self.acesso_particoes[ano] = agora
+        pendentes = sorted(a for a in anos if a not in self.particoes_carregadas)
+        
+        carregou = False
+        for ano in pendentes:
+            caminho = self.caminho_particao(ano)
+            if ano in self.particoes:
+                try:
+                    assinatura = assinatura_arquivo(caminho)
+                    with open(caminho, 'r', encoding='utf-8') as f:
+                        particao = json.load(f)
+                    if particao.get('unidade') != 'centavos':
+                        converter_lancamentos_reais(particao.get('gastos', []))
+                    for g in particao.get('gastos', []):
+                        # Categorias e tipos se repetem muito: uma única cópia de cada texto
+                        g['categoria'] = sys.intern(g['categoria'])
+                        if 'tipo' in g:  # Sem acrescentar a chave: a base da mesclagem é o conteúdo do arquivo
+                            g['tipo'] = sys.intern(g['tipo'])
+                        if 'tags' in g:
+                            g['tags'] = [sys.intern(tag) for tag in g['tags']]
+                    self.gastos.extend(particao.get('gastos', []))
+                    self.registrar_versao_particao(caminho, assinatura, particao.get('gastos', []))
+                    carregou = True
+                except Exception as e:
+                    # Sem marcar como carregada, a partição nunca é sobrescrita com dados parciais
+                    messagebox.showerror("Erro", f"Erro ao carregar gastos de {ano}: {str(e)}")
+                    raise
+            else:
+                # Ano ainda sem arquivo: se outro processo criá-lo, a verificação periódica o encontra
+                self.registrar_versao_particao(caminho, None, [])
+            self.particoes_carregadas.add(ano)
+        
+        if carregou:
+            self.indice_saldo.reconstruir(self.gastos)
+            self.motor_analitico.reconstruir(self.gastos)
+            self.cubo_lancamentos.reconstruir(self.gastos)
+            self.indice_tags.reconstruir(self.gastos)
+            self.instrumentacao.registrar_linhas(len(self.gastos))
+            if self.orcamento_memoria_mb:
+                # Só depois da ação atual, que ainda usa as partições recém-carregadas
+                self.root.after_idle(self.aplicar_orcamento_memoria)
+        return carregou
+    
+    def resumir_particao(self, gastos):
+        """Calcula os metadados de uma partição, usados sem precisar carregá-la"""
+        categorias = defaultdict(int)
+        meses = defaultdict(int)
+        tags = defaultdict(int)
+        receitas = 0
+        maior = None
+        for g in gastos:
+            if e_receita(g):
+                receitas += g['valor']
+                continue
+            # Um gasto dividido soma em cada categoria só o valor da sua parte
+            for categoria, valor in partes_lancamento(g):
+                categorias[categoria] += valor
+            for tag in g.get('tags', ()):
+                tags[tag] += g['valor']
+            meses[g['data'][:7]] += g['valor']
+            if maior is None or g['valor'] > maior['valor']:
+                maior = {'valor': g['valor'], 'categoria': g['categoria']}
+        
+        return {
+            'quantidade': len(gastos),
+            'total': sum(categorias.values()),
+            'receitas': receitas,
+            'categorias': dict(categorias),
+            'meses': dict(meses),
+            'tags': dict(tags),
+            'maior': maior,
+            'max_id': max((g['id'] for g in gastos), default=0)
+        }
+    
+    def agregados_historico(self):
+        """Totais de todo o histórico: metadados das partições não carregadas + lançamentos em memória"""
+        agregados = {
+            'quantidade': 0,
+            'total': 0,
+            'receitas': 0,
+            'categorias': defaultdict(int),
+            'meses': defaultdict(int),
+            'tags': defaultdict(int),
+            'maior': None
+        }
+        
+        fontes = [m for a, m in self.particoes.items() if a not in self.particoes_carregadas]
+        if self.gastos:
+            fontes.append(self.resumir_particao(self.gastos))
+        
+        for meta in fontes:
+            agregados['quantidade'] += meta['quantidade']
+            agregados['total'] += meta['total']
+            agregados['receitas'] += meta['receitas']
+            for categoria, valor in meta['categorias'].items():
+                agregados['categorias'][categoria] += valor
+            for mes, valor in meta['meses'].items():
+                agregados['meses'][mes] += valor
+            for tag, valor in meta.get('tags', {}).items():  # Metadados antigos não têm tags
+                agregados['tags'][tag] += valor
+            if meta['maior'] and (agregados['maior'] is None or meta['maior']['valor'] > agregados['maior']['valor']):
+                agregados['maior'] = meta['maior']
+        return agregados
+    
+    def deslocamento_saldo(self, ano):
+        """Saldo das partições não carregadas anteriores ao ano (complementa o índice de saldo)"""
+        return sum(
+            m['receitas'] - m['total'] for a, m in self.particoes.items()
+            if a not in self.particoes_carregadas and a < ano
+        )
+    
+    def proximo_id(self):
+        """Próximo id livre, considerando também as partições não carregadas"""
+        return max([g['id'] for g in self.gastos] + [m['max_id'] for m in self.particoes.values()] + [0]) + 1
+    
+    @com_escrita
+    def incluir_lancamentos(self, novos_gastos):
+        """Adiciona lançamentos garantindo que a partição de cada um esteja carregada"""
+        anos = {g['data'][:4] for g in novos_gastos}
+        self.garantir_particoes(anos)
+        self.gastos.extend(novos_gastos)
+        for gasto in novos_gastos:
+            self.indice_saldo.adicionar(gasto)
+            self.motor_analitico.adicionar(gasto)
+            self.cubo_lancamentos.adicionar(gasto)
+            self.indice_tags.adicionar(gasto)
+        self.particoes_alteradas.update(anos)
     
+    @com_escrita
+    def excluir_lancamentos(self, ids_gastos):
+        """Remove os lançamentos com os ids informados"""
+        ids_gastos = set(ids_gastos)
+        for g in self.gastos:
+            if g['id'] in ids_gastos:
+                self.indice_saldo.remover(g)
+                self.motor_analitico.remover(g)
+                self.cubo_lancamentos.remover(g)
+                self.indice_tags.remover(g)
+                self.particoes_alteradas.add(g['data'][:4])
+        self.gastos = [g for g in self.gastos if g['id'] not in ids_gastos]
+    
+    @instrumentado
+    @com_escrita
     def salvar_dados(self):
-        """Salva os dados no arquivo JSON e cria backup"""
+        """Salva as partições alteradas e o arquivo principal, criando backup"""
+        # Alterações feitas por outro processo são mescladas antes, para não serem sobrescritas
+        try:
+            self.recarregar_alteracoes_externas()
+            ilegiveis = self.arquivos_ilegiveis
+        except (OSError, ValueError) as e:
+            ilegiveis = [str(e)]
+        if ilegiveis:
+            # Depois de liberar a trava, para o aviso não bloquear a API enquanto está aberto
+            self.root.after_idle(lambda: messagebox.showwarning(
+                "Alterações Externas",
+                "Não foi possível ler estes arquivos, alterados por outro programa:\n\n" + "\n".join(ilegiveis) +
+                "\n\nAs alterações desta janela foram salvas mesmo assim e podem ter substituído as desses arquivos."
+            ))
+        
+        anos_alterados = sorted(self.particoes_alteradas)
+        por_ano = defaultdict(list)
+        for g in self.gastos:
+            if g['data'][:4] in self.particoes_alteradas:
+                por_ano[g['data'][:4]].append(g)
+        self.instrumentacao.registrar_linhas(sum(len(v) for v in por_ano.values()))
+        
         dados = {
-            'gastos': self.gastos,
+            'unidade': 'centavos',
             'limites': self.limites_categoria,
-            'categorias': self.categorias_predefinidas
+            'categorias': self.categorias_predefinidas,
+            'recorrencias': self.recorrencias
         }
         
         try:
-            # Criar backup antes de salvar
+            # Criar backup antes de salvar (apenas das partições alteradas)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = os.path.join(self.backup_dir, f'gastos_backup_{timestamp}.json')
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(dados, f, indent=2, ensure_ascii=False)
+            backup_path = os.path.join(self.backup_dir, f'{self.prefixo_backup()}{timestamp}.json')
+            gravar_json_atomico(backup_path, {
+                **dados,
+                'anos': anos_alterados,
+                'gastos': [g for ano in anos_alterados for g in por_ano[ano]]
+            }, indent=2, ensure_ascii=False)
+            
+            # Salvar partições alteradas e atualizar seus metadados
+            for ano in anos_alterados:
+                caminho = self.caminho_particao(ano)
+                if por_ano[ano]:
+                    if not os.path.exists(os.path.dirname(caminho)):
+                        os.makedirs(os.path.dirname(caminho))
+                    gravar_json_atomico(caminho, {'ano': ano, 'unidade': 'centavos', 'gastos': por_ano[ano]}, indent=2, ensure_ascii=False)
+                    self.particoes[ano] = self.resumir_particao(por_ano[ano])
+                else:
+                    if os.path.exists(caminho):
+                        os.remove(caminho)
+                    self.particoes.pop(ano, None)
+                self.registrar_versao_particao(caminho, assinatura_arquivo(caminho), por_ano[ano])
             
             # Salvar arquivo principal
-            with open(self.arquivo_dados, 'w', encoding='utf-8') as f:
-                json.dump(dados, f, indent=2, ensure_ascii=False)
+            gravar_json_atomico(self.arquivo_dados, {**dados, 'particoes': self.particoes}, indent=2, ensure_ascii=False)
+            self.registrar_versao_principal(assinatura_arquivo(self.arquivo_dados))
+            self.particoes_alteradas.clear()
                 
             # Manter apenas os 5 backups mais recentes
-            backups = sorted([f for f in os.listdir(self.backup_dir) if f.startswith('gastos_backup_')])
+            backups = sorted([f for f in os.listdir(self.backup_dir) if f.startswith(self.prefixo_backup())])
             for old_backup in backups[:-5]:
                 os.remove(os.path.join(self.backup_dir, old_backup))
+            
+            self.atualizar_resumo_carteira()
                 
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao salvar dados: {str(e)}")
@@ -123,13 +1585,34 @@ class GerenciadorGastosGUI:
     def restaurar_backup(self):
         """Restaura dados a partir do backup mais recente"""
         try:
-            backups = sorted([f for f in os.listdir(self.backup_dir) if f.startswith('gastos_backup_')], reverse=True)
+            backups = sorted([f for f in os.listdir(self.backup_dir) if f.startswith(self.prefixo_backup())], reverse=True)
             if backups:
-                with open(os.path.join(self.backup_dir, backups[0]), 'r', encoding='utf-8') as f:
-                    dados = json.load(f)
-                    self.gastos = dados.get('gastos', [])
-                    self.limites_categoria = dados.get('limites', {})
-                    self.categorias_predefinidas = dados.get('categorias', self.categorias_predefinidas)
+                with self.trava_dados.escrita():
+                    with open(os.path.join(self.backup_dir, backups[0]), 'r', encoding='utf-8') as f:
+                        dados = json.load(f)
+                        if dados.get('unidade') != 'centavos':
+                            dados['limites'] = {c: centavos_de_reais(v) for c, v in dados.get('limites', {}).items()}
+                            converter_lancamentos_reais(dados.get('recorrencias', []))
+                            converter_lancamentos_reais(dados.get('gastos', []))
+                    
+                        if 'anos' in dados:  # Backup parcial: substitui só as partições salvas nele
+                            anos = set(dados['anos'])
+                            self.garantir_particoes(anos)
+                            self.gastos = [g for g in self.gastos if g['data'][:4] not in anos] + dados.get('gastos', [])
+                            self.particoes_alteradas.update(anos)
+                        else:  # Backup completo
+                            self.gastos = dados.get('gastos', [])
+                            self.particoes = {}
+                            self.particoes_carregadas = {g['data'][:4] for g in self.gastos}
+                            self.particoes_alteradas = set(self.particoes_carregadas)
+                    
+                        self.limites_categoria = dados.get('limites', {})
+                        self.categorias_predefinidas = dados.get('categorias', self.categorias_predefinidas)
+                        self.recorrencias = dados.get('recorrencias', [])
+                    self.indice_saldo.reconstruir(self.gastos)
+                    self.motor_analitico.reconstruir(self.gastos)
+                    self.cubo_lancamentos.reconstruir(self.gastos)
+                    self.indice_tags.reconstruir(self.gastos)
                 messagebox.showinfo("Sucesso", "Backup restaurado com sucesso!")
                 self.atualizar_lista_gastos()
             else:
@@ -137,6 +1620,319 @@ class GerenciadorGastosGUI:
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao restaurar backup: {str(e)}")
     
+    def prefixo_backup(self):
+        """Retorna o prefixo dos arquivos de backup da carteira ativa"""
+        return f"{os.path.splitext(os.path.basename(self.arquivo_dados))[0]}_backup_"
+    
+    def carregar_carteiras(self):
+        """Carrega o índice de carteiras e seleciona a carteira ativa"""
+        if os.path.exists(self.arquivo_carteiras):
+            try:
+                with open(self.arquivo_carteiras, 'r', encoding='utf-8') as f:
+                    indice = json.load(f)
+                    self.carteiras = indice.get('carteiras', {})
+                    if indice.get('unidade') != 'centavos':
+                        for carteira in self.carteiras.values():
+                            converter_resumo_reais(carteira.get('resumo', {}))
+                    self.carteira_ativa = indice.get('ativa', self.carteira_ativa)
+                    self.orcamento_memoria_mb = indice.get('orcamento_memoria_mb', self.orcamento_memoria_mb)
+            except Exception as e:
+                messagebox.showerror("Erro", f"Erro ao carregar carteiras: {str(e)}")
+        
+        # A carteira padrão continua usando o arquivo original
+        if not self.carteiras:
+            self.carteiras = {'Pessoal': {'arquivo': self.arquivo_dados, 'resumo': {}}}
+        if self.carteira_ativa not in self.carteiras:
+            self.carteira_ativa = next(iter(self.carteiras))
+        
+        self.arquivo_dados = self.carteiras[self.carteira_ativa]['arquivo']
+        self.root.title(f"💰 Gestor Financeiro Pessoal - {self.carteira_ativa}")
+    
+    def salvar_carteiras(self):
+        """Salva o índice de carteiras com os resumos agregados de cada uma"""
+        indice = {
+            'unidade': 'centavos',
+            'ativa': self.carteira_ativa,
+            'orcamento_memoria_mb': self.orcamento_memoria_mb,
+            'carteiras': self.carteiras
+        }
+        
+        try:
+            gravar_json_atomico(self.arquivo_carteiras, indice, indent=2, ensure_ascii=False)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao salvar carteiras: {str(e)}")
+    
+    def atualizar_resumo_carteira(self):
+        """Recalcula os agregados da carteira ativa usados no resumo consolidado"""
+        agregados = self.agregados_historico()
+        
+        self.carteiras[self.carteira_ativa]['resumo'] = {
+            'quantidade': agregados['quantidade'],
+            'total': agregados['total'],
+            'receitas': agregados['receitas'],
+            'categorias': dict(agregados['categorias']),
+            'meses': dict(agregados['meses']),
+            'atualizado_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        self.salvar_carteiras()
+    
+    @instrumentado
+    @com_escrita
+    def trocar_carteira(self, nome):
+        """Torna outra carteira ativa, carregando-a do disco apenas se necessário"""
+        if nome == self.carteira_ativa:
+            return
+        
+        # Anos pendentes pertencem a esta carteira: gravados aqui, nunca nos arquivos da próxima
+        if self.particoes_alteradas:
+            self.salvar_dados()
+        
+        # Manter a carteira atual em memória para trocas rápidas
+        self.carteiras_abertas[self.carteira_ativa] = {
+            'gastos': self.gastos,
+            'limites': self.limites_categoria,
+            'categorias': self.categorias_predefinidas,
+            'recorrencias': self.recorrencias,
+            'particoes': self.particoes,
+            'particoes_carregadas': self.particoes_carregadas,
+            'particoes_alteradas': self.particoes_alteradas,  # Só não fica vazio se o salvamento falhou
+            'ultimo_acesso': time.time()
+        }
+        
+        self.carteira_ativa = nome
+        self.arquivo_dados = self.carteiras[nome]['arquivo']
+        
+        estado = self.carteiras_abertas.pop(nome, None)
+        if estado:
+            self.gastos = estado['gastos']
+            self.limites_categoria = estado['limites']
+            self.categorias_predefinidas = estado['categorias']
+            self.recorrencias = estado['recorrencias']
+            self.particoes = estado['particoes']
+            self.particoes_carregadas = estado['particoes_carregadas']
+            self.particoes_alteradas = estado['particoes_alteradas']
+        else:
+            self.gastos = []
+            self.limites_categoria = {}
+            self.categorias_predefinidas = list(self.categorias_padrao)
+            self.recorrencias = []
+            self.particoes = {}
+            self.particoes_carregadas = set()
+            self.particoes_alteradas = set()
+            self.carregar_dados()
+        self.indice_saldo.reconstruir(self.gastos)
+        self.motor_analitico.reconstruir(self.gastos)
+        self.cubo_lancamentos.reconstruir(self.gastos)
+        self.indice_tags.reconstruir(self.gastos)
+        
+        self.liberar_carteiras_ociosas(agendar=False)
+        self.salvar_carteiras()
+        
+        self.root.title(f"💰 Gestor Financeiro Pessoal - {nome}")
+        self.carteira_var.set(nome)
+        self.categoria_combobox['values'] = self.categorias_predefinidas
+        self.processar_recorrencias(agendar=False)
+        self.atualizar_lista_gastos()
+        self.atualizar_estatisticas()
+    
+    def liberar_carteiras_ociosas(self, agendar=True):
+        """Remove da memória carteiras inativas há muito tempo ou em excesso"""
+        agora = time.time()
+        for nome, estado in list(self.carteiras_abertas.items()):
+            if agora - estado['ultimo_acesso'] > self.tempo_ociosidade_carteira and not estado['particoes_alteradas']:
+                del self.carteiras_abertas[nome]
+        
+        # Respeitar o limite de carteiras em memória, descartando as menos usadas (alterações não salvas ficam)
+        excedentes = sorted(
+            (n for n in self.carteiras_abertas if not self.carteiras_abertas[n]['particoes_alteradas']),
+            key=lambda n: self.carteiras_abertas[n]['ultimo_acesso']
+        )
+        for nome in excedentes[:max(0, len(self.carteiras_abertas) - self.max_carteiras_em_memoria + 1)]:
+            del self.carteiras_abertas[nome]
+        
+        if self.orcamento_memoria_mb:
+            self.aplicar_orcamento_memoria()
+        
+        if agendar:
+            self.root.after(60 * 1000, self.liberar_carteiras_ociosas)
+    
+    def uso_memoria(self):
+        """Estimativa, em bytes, da memória usada por cada estrutura de dados"""
+        return {
+            'Lançamentos carregados': estimar_bytes(self.gastos),
+            'Índice de saldo': estimar_bytes(self.indice_saldo.arvore) + estimar_bytes(self.indice_saldo.por_dia),
+            'Previsão e anomalias': estimar_bytes(self.motor_analitico.totais) + estimar_bytes(self.motor_analitico.valores)
+                                    + estimar_bytes(self.motor_analitico.registros) + estimar_bytes(self.motor_analitico.datas)
+                                    + sys.getsizeof(self.motor_analitico.lancamentos),
+            'Cubo de relatórios': estimar_bytes(self.cubo_lancamentos.celulas) + estimar_bytes(self.cubo_lancamentos.registros)
+                                  + estimar_bytes(self.cubo_lancamentos.cache),
+            'Índice de tags': estimar_bytes(self.indice_tags.bitmaps) + estimar_bytes(self.indice_tags.registros)
+                              + sys.getsizeof(self.indice_tags.todos),
+            'Base de mesclagem externa': estimar_bytes(self.bases_arquivos),
+            'Cache de imagens': self.cache_imagens.bytes,
+            'Carteiras inativas em memória': estimar_bytes(self.carteiras_abertas),
+            'Linhas da tabela (estimado)': len(self.tree.get_children()) * 500 if hasattr(self, 'tree') else 0
+        }
+    
+    def aplicar_orcamento_memoria(self):
+        """No modo de memória limitada, libera estruturas até caber no orçamento.
+        
+        Primeiro saem as carteiras inativas e o cache de imagens; depois as
+        partições anuais menos usadas, que já estão em disco e voltam a ser lidas
+        quando necessário. O ano atual, o anterior, partições com alterações não
+        salvas, as da visualização filtrada e as reservadas por um consumidor
+        (reservar_particoes) nunca são descartadas.
+        """
+        orcamento = self.orcamento_memoria_mb * 1024 * 1024
+        if not orcamento or sum(self.uso_memoria().values()) <= orcamento:
+            return
+        
+        for nome in [n for n, estado in self.carteiras_abertas.items() if not estado['particoes_alteradas']]:
+            del self.carteiras_abertas[nome]
+        self.cache_imagens.itens.clear()
+        self.cache_imagens.bytes = 0
+        
+        hoje = datetime.now()
+        protegidos = {hoje.strftime('%Y'), (hoje.replace(day=1) - timedelta(days=1)).strftime('%Y')}
+        protegidos |= self.particoes_alteradas
+        if self.lancamentos_exibidos is not None:
+            protegidos |= {g['data'][:4] for g in self.lancamentos_exibidos}
+        with self.trava_reservas:
+            protegidos |= set(self.particoes_reservadas)
+        frias = sorted(
+            (a for a in self.particoes_carregadas if a in self.particoes and a not in protegidos),
+            key=lambda a: self.acesso_particoes.get(a, 0)
+        )
+        
+        descartadas = []
+        with self.instrumentacao.medir('aplicar_orcamento_memoria'):
+            while frias and sum(self.uso_memoria().values()) > orcamento:
+                descartadas.append(frias.pop(0))
+                self.descarregar_particoes({descartadas[-1]})
+        
+        if descartadas and self.lancamentos_exibidos is None:
+            self.atualizar_lista_gastos()
+    
+    def reservar_particoes(self, anos):
+        """Impede que o orçamento de memória descarregue estes anos até liberar_reserva_particoes"""
+        with self.trava_reservas:
+            self.particoes_reservadas.update(anos)
+    
+    def liberar_reserva_particoes(self, anos):
+        """Desfaz uma reserva de reservar_particoes"""
+        with self.trava_reservas:
+            self.particoes_reservadas.subtract(anos)
+            self.particoes_reservadas = +self.particoes_reservadas  # Remove os anos sem reserva
+    
+    @com_escrita
+    def descarregar_particoes(self, anos):
+        """Tira da memória partições já salvas; os metadados continuam disponíveis"""
+        self.gastos = [g for g in self.gastos if g['data'][:4] not in anos]
+        for ano in anos:
+            self.particoes_carregadas.discard(ano)
+            caminho = self.caminho_particao(ano)
+            self.assinaturas_arquivos.pop(caminho, None)
+            self.bases_arquivos.pop(caminho, None)
+        self.indice_saldo.reconstruir(self.gastos)
+        self.motor_analitico.reconstruir(self.gastos)
+        self.cubo_lancamentos.reconstruir(self.gastos)
+        self.indice_tags.reconstruir(self.gastos)
+    
+    def definir_orcamento_memoria(self):
+        """Configura o modo de memória limitada"""
+        orcamento = simpledialog.askinteger(
+            "Limite de Memória",
+            "Orçamento de memória para os dados, em MB (0 = sem limite):",
+            initialvalue=self.orcamento_memoria_mb, minvalue=0, parent=self.root
+        )
+        if orcamento is None:
+            return
+        self.orcamento_memoria_mb = orcamento
+        self.salvar_carteiras()
+        self.aplicar_orcamento_memoria()
+        self.atualizar_lista_gastos(self.lancamentos_exibidos)
+    
+    def nova_carteira(self):
+        """Cria uma nova carteira com armazenamento próprio"""
+        nome = simpledialog.askstring("Nova Carteira", "Nome da carteira (ex.: Casa, Empresa):")
+        if not nome or not nome.strip():
+            return
+        nome = nome.strip()
+        
+        if nome in self.carteiras:
+            messagebox.showwarning("Aviso", f"A carteira {nome} já existe!")
+            return
+        
+        # Nome de arquivo sem acentos ou caracteres especiais
+        base = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+        base = re.sub(r'[^a-z0-9]+', '_', base.lower()).strip('_') or 'carteira'
+        arquivo = os.path.join(self.carteiras_dir, f'{base}.json')
+        contador = 2
+        while any(c['arquivo'] == arquivo for c in self.carteiras.values()) or os.path.exists(arquivo):
+            arquivo = os.path.join(self.carteiras_dir, f'{base}_{contador}.json')
+            contador += 1
+        
+        if not os.path.exists(self.carteiras_dir):
+            os.makedirs(self.carteiras_dir)
+        
+        self.carteiras[nome] = {'arquivo': arquivo, 'resumo': {}}
+        self.atualizar_menu_carteiras()
+        self.trocar_carteira(nome)
+        self.salvar_dados()
+        messagebox.showinfo("Sucesso", f"Carteira {nome} criada com sucesso!")
+    
+    def atualizar_menu_carteiras(self):
+        """Recria as opções de carteira no menu"""
+        self.carteira_menu.delete(0, tk.END)
+        for nome in sorted(self.carteiras):
+            self.carteira_menu.add_radiobutton(label=nome, variable=self.carteira_var, value=nome,
+                                               command=lambda n=nome: self.trocar_carteira(n))
+        self.carteira_menu.add_separator()
+        self.carteira_menu.add_command(label="Nova Carteira", command=self.nova_carteira)
+        self.carteira_menu.add_command(label="Resumo Consolidado", command=self.mostrar_resumo_consolidado)
+    
+    @instrumentado
+    def mostrar_resumo_consolidado(self):
+        """Mostra os totais de todas as carteiras a partir dos agregados salvos"""
+        self.atualizar_resumo_carteira()
+        mes_atual = datetime.now().strftime('%Y-%m')
+        
+        total_geral = 0
+        total_mes = 0
+        total_receitas = 0
+        categorias = defaultdict(int)
+        linhas = []
+        for nome in sorted(self.carteiras):
+            resumo = self.carteiras[nome].get('resumo', {})
+            total = resumo.get('total', 0)
+            total_geral += total
+            total_mes += resumo.get('meses', {}).get(mes_atual, 0)
+            total_receitas += resumo.get('receitas', 0)
+            for categoria, valor in resumo.get('categorias', {}).items():
+                categorias[categoria] += valor
+            linhas.append(f"{nome}: {formatar_brl(total)} ({resumo.get('quantidade', 0)} gastos)\n")
+        
+        resumo_texto = "=== RESUMO CONSOLIDADO ===\n\n"
+        resumo_texto += f"Total Geral: {formatar_brl(total_geral)}\n"
+        resumo_texto += f"Total Mês Atual ({datetime.now().strftime('%m/%Y')}): {formatar_brl(total_mes)}\n"
+        resumo_texto += f"Receitas: {formatar_brl(total_receitas)} | Saldo: {formatar_brl(total_receitas - total_geral)}\n\n"
+        resumo_texto += "=== POR CARTEIRA ===\n\n" + ''.join(linhas)
+        resumo_texto += "\n=== POR CATEGORIA ===\n\n"
+        for categoria, total in sorted(categorias.items(), key=lambda x: x[1], reverse=True):
+            resumo_texto += f"{categoria}: {formatar_brl(total)}\n"
+        
+        self.notebook.select(0)
+        self.resumo_text.config(state=tk.NORMAL)
+        self.resumo_text.delete(1.0, tk.END)
+        self.resumo_text.insert(tk.END, resumo_texto)
+        self.resumo_text.config(state=tk.DISABLED)
+    
+    def carregar_historico_completo(self):
+        """Carrega todas as partições e exibe o histórico inteiro"""
+        self.garantir_particoes()
+        self.atualizar_lista_gastos()
+        self.atualizar_estatisticas()
+    
     def criar_menu(self):
         """Cria a barra de menu superior"""
         menubar = tk.Menu(self.root)
@@ -144,7 +1940,13 @@ class GerenciadorGastosGUI:
         # Menu Arquivo
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="Exportar Dados", command=self.exportar_dados)
+        file_menu.add_command(label="Exportar Visualização Atual", command=self.exportar_visualizacao)
         file_menu.add_command(label="Importar Dados", command=self.importar_dados)
+        file_menu.add_command(label="Carregar Histórico Completo", command=self.carregar_historico_completo)
+        file_menu.add_command(label="Limite de Memória...", command=self.definir_orcamento_memoria)
+        self.servidor_api_var = tk.BooleanVar(value=False)
+        file_menu.add_checkbutton(label="Servidor de API Local", variable=self.servidor_api_var,
+                                  command=self.alternar_servidor_api)
         file_menu.add_separator()
         file_menu.add_command(label="Backup Agora", command=self.criar_backup_manual)
         file_menu.add_command(label="Restaurar Backup", command=self.restaurar_backup)
@@ -154,6 +1956,23 @@ class GerenciadorGastosGUI:
         file_menu.add_command(label="Sair", command=self.root.quit)
         menubar.add_cascade(label="Arquivo", menu=file_menu)
         
+        # Menu Carteiras
+        self.carteira_var = tk.StringVar(value=self.carteira_ativa)
+        self.carteira_menu = tk.Menu(menubar, tearoff=0)
+        self.atualizar_menu_carteiras()
+        menubar.add_cascade(label="Carteiras", menu=self.carteira_menu)
+        
+        # Menu Recorrências
+        recorrencia_menu = tk.Menu(menubar, tearoff=0)
+        recorrencia_menu.add_command(label="Gerenciar Recorrências", command=self.mostrar_dialogo_recorrencias)
+        recorrencia_menu.add_command(label="Lançar Recorrências Pendentes", command=self.processar_recorrencias_manual)
+        menubar.add_cascade(label="Recorrências", menu=recorrencia_menu)
+        
+        # Menu Relatórios
+        relatorio_menu = tk.Menu(menubar, tearoff=0)
+        relatorio_menu.add_command(label="Construtor de Relatórios", command=self.mostrar_construtor_relatorios)
+        menubar.add_cascade(label="Relatórios", menu=relatorio_menu)
+        
         # Menu Ajuda
         help_menu = tk.Menu(menubar, tearoff=0)
         help_menu.add_command(label="Sobre", command=self.mostrar_sobre)
@@ -161,6 +1980,9 @@ class GerenciadorGastosGUI:
         menubar.add_cascade(label="Ajuda", menu=help_menu)
         
         self.root.config(menu=menubar)
+        
+        # Janela de diagnóstico oculta (Ctrl+Shift+D)
+        self.root.bind('<Control-Shift-D>', lambda e: self.mostrar_diagnostico())
     
     def criar_widgets(self):
         """Cria todos os widgets da interface"""
@@ -169,30 +1991,44 @@ class GerenciadorGastosGUI:
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # Frame de entrada de dados (lado esquerdo)
-        input_frame = ttk.LabelFrame(main_frame, text="➕ Novo Gasto", padding=10)
+        input_frame = ttk.LabelFrame(main_frame, text="➕ Novo Lançamento", padding=10)
         input_frame.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
         
         # Campos de entrada
-        ttk.Label(input_frame, text="Valor (R$):").grid(row=0, column=0, sticky="w", pady=2)
+        ttk.Label(input_frame, text="Tipo:").grid(row=0, column=0, sticky="w", pady=2)
+        self.tipo_combobox = ttk.Combobox(input_frame, values=['Despesa', 'Receita'], state='readonly', font=('Arial', 11))
+        self.tipo_combobox.current(0)
+        self.tipo_combobox.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(input_frame, text="Valor (R$):").grid(row=1, column=0, sticky="w", pady=2)
         self.valor_entry = ttk.Entry(input_frame, font=('Arial', 11))
-        self.valor_entry.grid(row=0, column=1, sticky="ew", padx=5, pady=2)
+        self.valor_entry.grid(row=1, column=1, sticky="ew", padx=5, pady=2)
         
-        ttk.Label(input_frame, text="Categoria:").grid(row=1, column=0, sticky="w", pady=2)
+        ttk.Label(input_frame, text="Categoria:").grid(row=2, column=0, sticky="w", pady=2)
         self.categoria_combobox = ttk.Combobox(input_frame, values=self.categorias_predefinidas, font=('Arial', 11))
-        self.categoria_combobox.grid(row=1, column=1, sticky="ew", padx=5, pady=2)
+        self.categoria_combobox.grid(row=2, column=1, sticky="ew", padx=5, pady=2)
         self.categoria_combobox.bind('<KeyRelease>', self.autocompletar_categoria)
         
-        ttk.Label(input_frame, text="Data:").grid(row=2, column=0, sticky="w", pady=2)
+        ttk.Label(input_frame, text="Data:").grid(row=3, column=0, sticky="w", pady=2)
         self.data_entry = DateEntry(input_frame, date_pattern='dd/mm/yyyy', font=('Arial', 11))
-        self.data_entry.grid(row=2, column=1, sticky="ew", padx=5, pady=2)
+        self.data_entry.grid(row=3, column=1, sticky="ew", padx=5, pady=2)
         
-        ttk.Label(input_frame, text="Descrição:").grid(row=3, column=0, sticky="w", pady=2)
+        ttk.Label(input_frame, text="Descrição:").grid(row=4, column=0, sticky="w", pady=2)
         self.descricao_entry = ttk.Entry(input_frame, font=('Arial', 11))
-        self.descricao_entry.grid(row=3, column=1, sticky="ew", padx=5, pady=2)
+        self.descricao_entry.grid(row=4, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(input_frame, text="Tags:").grid(row=5, column=0, sticky="w", pady=2)
+        self.tags_entry = ttk.Entry(input_frame, font=('Arial', 11))
+        self.tags_entry.grid(row=5, column=1, sticky="ew", padx=5, pady=2)
+        
+        # Opcional: 'Alimentação: 30,00; Casa: 20,00' reparte o valor entre categorias
+        ttk.Label(input_frame, text="Divisão:").grid(row=6, column=0, sticky="w", pady=2)
+        self.divisao_entry = ttk.Entry(input_frame, font=('Arial', 11))
+        self.divisao_entry.grid(row=6, column=1, sticky="ew", padx=5, pady=2)
         
         # Botão adicionar
-        add_btn = ttk.Button(input_frame, text="Adicionar Gasto", style='Primary.TButton', command=self.adicionar_gasto)
-        add_btn.grid(row=4, column=0, columnspan=2, pady=10, sticky="ew")
+        add_btn = ttk.Button(input_frame, text="Adicionar Lançamento", style='Primary.TButton', command=self.adicionar_gasto)
+        add_btn.grid(row=7, column=0, columnspan=2, pady=10, sticky="ew")
         
         # Frame de estatísticas rápidas
         stats_frame = ttk.LabelFrame(main_frame, text="📊 Estatísticas", padding=10)
@@ -202,6 +2038,8 @@ class GerenciadorGastosGUI:
         self.total_mes_var = tk.StringVar(value="R$ 0,00")
         self.maior_gasto_var = tk.StringVar(value="R$ 0,00 - Nenhum")
         self.categoria_mais_gasto_var = tk.StringVar(value="Nenhuma")
+        self.saldo_var = tk.StringVar(value="R$ 0,00")
+        self.fluxo_mes_var = tk.StringVar(value="R$ 0,00")
         
         ttk.Label(stats_frame, text="Gasto Mensal:").grid(row=0, column=0, sticky="w")
         ttk.Label(stats_frame, textvariable=self.total_mes_var, font=('Arial', 10, 'bold')).grid(row=0, column=1, sticky="e")
@@ -212,29 +2050,38 @@ class GerenciadorGastosGUI:
         ttk.Label(stats_frame, text="Categoria com Mais Gastos:").grid(row=2, column=0, sticky="w")
         ttk.Label(stats_frame, textvariable=self.categoria_mais_gasto_var, font=('Arial', 10, 'bold')).grid(row=2, column=1, sticky="e")
         
-        # Atualizar estatísticas
-        self.atualizar_estatisticas()
+        ttk.Label(stats_frame, text="Saldo Atual:").grid(row=3, column=0, sticky="w")
+        ttk.Label(stats_frame, textvariable=self.saldo_var, font=('Arial', 10, 'bold')).grid(row=3, column=1, sticky="e")
+        
+        ttk.Label(stats_frame, text="Fluxo do Mês:").grid(row=4, column=0, sticky="w")
+        ttk.Label(stats_frame, textvariable=self.fluxo_mes_var, font=('Arial', 10, 'bold')).grid(row=4, column=1, sticky="e")
         
         # Frame de lista de gastos (centro)
         list_frame = ttk.LabelFrame(main_frame, text="📋 Lista de Gastos", padding=10)
         list_frame.grid(row=0, column=1, rowspan=2, sticky="nsew", padx=5, pady=5)
         
         # Treeview para lista de gastos
-        columns = ('id', 'data', 'valor', 'categoria', 'descricao')
+        columns = ('id', 'data', 'valor', 'saldo', 'categoria', 'descricao', 'tags')
         self.tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15, selectmode='extended')
         
         # Configurar colunas
         self.tree.heading('id', text='ID', anchor='center')
         self.tree.heading('data', text='Data', anchor='center')
         self.tree.heading('valor', text='Valor (R$)', anchor='e')
+        self.tree.heading('saldo', text='Saldo (R$)', anchor='e')
         self.tree.heading('categoria', text='Categoria', anchor='center')
         self.tree.heading('descricao', text='Descrição', anchor='w')
+        self.tree.heading('tags', text='Tags', anchor='w')
         
         self.tree.column('id', width=50, anchor='center')
         self.tree.column('data', width=100, anchor='center')
         self.tree.column('valor', width=100, anchor='e')
+        self.tree.column('saldo', width=100, anchor='e')
         self.tree.column('categoria', width=120, anchor='center')
         self.tree.column('descricao', width=200, anchor='w')
+        self.tree.column('tags', width=120, anchor='w')
+        self.tree.tag_configure('projetado', foreground='#888888', font=('Arial', 9, 'italic'))
+        self.tree.tag_configure('receita', foreground='#2e7d32')
         
         self.tree.grid(row=0, column=0, sticky="nsew")
         
@@ -253,6 +2100,14 @@ class GerenciadorGastosGUI:
         ttk.Button(btn_frame, text="Limpar Filtros", style='Secondary.TButton', command=self.limpar_filtros).pack(side=tk.LEFT, padx=2)
         ttk.Button(btn_frame, text="Exportar Seleção", style='Secondary.TButton', command=self.exportar_selecao).pack(side=tk.LEFT, padx=2)
         
+        self.mostrar_projecoes_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btn_frame, text="Mostrar Previstos", variable=self.mostrar_projecoes_var,
+                       command=self.atualizar_lista_gastos).pack(side=tk.LEFT, padx=2)
+        
+        self.historico_var = tk.StringVar()
+        ttk.Label(list_frame, textvariable=self.historico_var, foreground='#888888').grid(
+            row=2, column=0, columnspan=2, sticky="w")
+        
         # Frame de resumo e gráficos (lado direito)
         right_frame = ttk.Frame(main_frame)
         right_frame.grid(row=0, column=2, rowspan=2, sticky="nsew", padx=5, pady=5)
@@ -271,12 +2126,24 @@ class GerenciadorGastosGUI:
         self.resumo_text = tk.Text(resumo_tab, wrap=tk.WORD, height=10, font=('Arial', 10))
         self.resumo_text.pack(fill=tk.BOTH, expand=True, pady=5)
         
+        # Aba de previsão e anomalias
+        previsao_tab = ttk.Frame(self.notebook)
+        self.notebook.add(previsao_tab, text="🔮 Previsão")
+        
+        ttk.Button(previsao_tab, text="Atualizar Previsão", style='Primary.TButton',
+                  command=self.mostrar_analise).pack(fill=tk.X, pady=5)
+        
+        self.previsao_text = tk.Text(previsao_tab, wrap=tk.WORD, height=10, font=('Arial', 10))
+        self.previsao_text.pack(fill=tk.BOTH, expand=True, pady=5)
+        
         # Aba de gráficos
         graph_tab = ttk.Frame(self.notebook)
         self.notebook.add(graph_tab, text="📊 Gráficos")
         
         ttk.Button(graph_tab, text="Gerar Gráficos", style='Primary.TButton',
                   command=self.gerar_graficos).pack(fill=tk.X, pady=5)
+        ttk.Button(graph_tab, text="Exportar Gráficos de Todos os Meses", style='Secondary.TButton',
+                  command=self.exportar_graficos_lote).pack(fill=tk.X, pady=(0, 5))
         
         self.graph_frame = ttk.Frame(graph_tab)
         self.graph_frame.pack(fill=tk.BOTH, expand=True)
@@ -290,6 +2157,9 @@ class GerenciadorGastosGUI:
         
         list_frame.columnconfigure(0, weight=1)
         list_frame.rowconfigure(0, weight=1)
+        
+        # Atualizar estatísticas (só agora: a previsão escreve na aba criada acima)
+        self.atualizar_estatisticas()
     
     def autocompletar_categoria(self, event):
         """Autocompleta a categoria baseado nas categorias predefinidas"""
@@ -302,111 +2172,401 @@ class GerenciadorGastosGUI:
         else:
             self.categoria_combobox['values'] = self.categorias_predefinidas
     
+    def registrar_categorias(self, categorias):
+        """Inclui nas categorias predefinidas as que ainda não existem"""
+        novas = {c.strip() for c in categorias if c.strip()} - set(self.categorias_predefinidas)
+        if novas:
+            self.categorias_predefinidas = sorted(set(self.categorias_predefinidas) | novas)
+            self.categoria_combobox['values'] = self.categorias_predefinidas
+    
+    @instrumentado
     def adicionar_gasto(self):
         """Adiciona um novo gasto à lista"""
-        valor = self.valor_entry.get().replace(',', '.')
+        valor = self.valor_entry.get()
         categoria = self.categoria_combobox.get()
         descricao = self.descricao_entry.get()
         data = self.data_entry.get_date()
+        tipo = 'receita' if self.tipo_combobox.get() == 'Receita' else 'despesa'
+        tags = interpretar_tags(self.tags_entry.get())
         
         try:
-            valor = float(valor)
+            valor = para_centavos(valor)
             if valor <= 0:
                 messagebox.showwarning("Aviso", "O valor deve ser positivo!")
                 return
         except ValueError:
             messagebox.showwarning("Aviso", "Valor inválido! Digite um número.")
             return
+        
+        try:
+            divisoes = interpretar_divisoes(self.divisao_entry.get(), valor)
+        except ValueError as e:
+            messagebox.showwarning("Aviso", str(e))
+            return
             
-        if not categoria.strip():
+        if not categoria.strip() and not divisoes:
             messagebox.showwarning("Aviso", "A categoria não pode ser vazia!")
             return
             
-        # Adicionar nova categoria se não existir
-        if categoria not in self.categorias_predefinidas:
-            self.categorias_predefinidas.append(categoria)
-            self.categorias_predefinidas.sort()
-            self.categoria_combobox['values'] = self.categorias_predefinidas
+        # Adicionar novas categorias se não existirem
+        self.registrar_categorias([categoria] + [d['categoria'] for d in divisoes])
         
         # Criar novo gasto
-        novo_id = max([g['id'] for g in self.gastos] + [0]) + 1
+        novo_id = self.proximo_id()
         gasto = {
             'id': novo_id,
             'data': data.strftime('%Y-%m-%d %H:%M:%S'),
             'valor': valor,
             'categoria': categoria.strip(),
-            'descricao': descricao.strip()
+            'descricao': descricao.strip(),
+            'tipo': tipo
         }
+        classificar_lancamento(gasto, tags, divisoes)
+        categoria = gasto['categoria']
         
-        self.gastos.append(gasto)
+        self.incluir_lancamentos([gasto])
         self.salvar_dados()
         
         # Limpar campos e atualizar interface
         self.valor_entry.delete(0, tk.END)
         self.categoria_combobox.set('')
         self.descricao_entry.delete(0, tk.END)
+        self.tags_entry.delete(0, tk.END)
+        self.divisao_entry.delete(0, tk.END)
         self.data_entry.set_date(datetime.now())
         
         self.atualizar_lista_gastos()
         self.atualizar_estatisticas()
-        self.verificar_limite_categoria(categoria)
         
-        messagebox.showinfo("Sucesso", f"Gasto de R${valor:.2f} em {categoria} registrado com sucesso!")
+        if tipo == 'receita':
+            messagebox.showinfo("Sucesso", f"Receita de {formatar_brl(valor)} em {categoria} registrada com sucesso!")
+            return
+        
+        for categoria_parte, _ in partes_lancamento(gasto):
+            self.verificar_limite_categoria(categoria_parte)
+        if divisoes:
+            categoria = ", ".join(d['categoria'] for d in divisoes)
+        mensagem = f"Gasto de {formatar_brl(valor)} em {categoria} registrado com sucesso!"
+        escore = self.motor_analitico.escore(gasto)
+        if escore is not None and escore > self.limiar_anomalia:
+            mensagem += f"\n\nAtenção: valor bem acima do habitual para {categoria} (escore {escore:.1f})."
+        messagebox.showinfo("Sucesso", mensagem)
     
+    @instrumentado
     def atualizar_lista_gastos(self, gastos=None):
         """Atualiza a lista de gastos na Treeview"""
+        self.lancamentos_exibidos = gastos
         if gastos is None:
             gastos = self.gastos
+            # Lançamentos previstos são exibidos apenas na lista completa, sem serem armazenados
+            if self.mostrar_projecoes_var.get():
+                gastos = gastos + self.projetar_recorrencias(datetime.now() + timedelta(days=self.dias_projecao))
         
-        # Ordenar por data (mais recente primeiro)
-        gastos_ordenados = sorted(gastos, key=lambda x: x['data'], reverse=True)
+        # Ordenar por data (mais recente primeiro); com memória limitada, só as linhas exibidas
+        total_linhas = len(gastos)
+        if self.orcamento_memoria_mb and total_linhas > self.max_linhas_tabela:
+            gastos_ordenados = heapq.nlargest(self.max_linhas_tabela, gastos, key=lambda x: x['data'])
+        else:
+            gastos_ordenados = sorted(gastos, key=lambda x: x['data'], reverse=True)
+        self.instrumentacao.registrar_linhas(total_linhas)
         
         # Limpar treeview
         for item in self.tree.get_children():
             self.tree.delete(item)
             
         # Preencher com novos dados
-        for gasto in gastos_ordenados:
-            data_formatada = datetime.strptime(gasto['data'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-            self.tree.insert('', tk.END, values=(
-                gasto['id'],
-                data_formatada,
-                f"{gasto['valor']:,.2f}".replace('.', '|').replace(',', '.').replace('|', ','),
-                gasto['categoria'],
-                gasto['descricao']
+        deslocamentos = {}  # Saldo das partições anteriores não carregadas, por ano
+        for posicao, gasto in enumerate(gastos_ordenados):
+            projetado = gasto.get('projetado', False)
+            valores, tags = self.valores_linha(gasto, deslocamentos)
+            # O iid da linha é o id do lançamento; nada é lido de volta do texto exibido
+            self.tree.insert('', tk.END, iid=f'previsto_{posicao}' if projetado else str(gasto['id']),
+                             values=valores, tags=tags)
+        
+        # Informar quanto do histórico ainda está apenas em disco
+        avisos = []
+        if len(gastos_ordenados) < total_linhas:
+            avisos.append(f"Exibindo os {len(gastos_ordenados)} mais recentes de {total_linhas} lançamentos (memória limitada).")
+        nao_carregados = sum(m['quantidade'] for a, m in self.particoes.items() if a not in self.particoes_carregadas)
+        if nao_carregados:
+            anos = sorted(a for a in self.particoes if a not in self.particoes_carregadas)
+            avisos.append(
+                f"{nao_carregados} lançamento(s) de {anos[0]}–{anos[-1]} não carregado(s). "
+                "Use os filtros ou Arquivo → Carregar Histórico Completo."
+            )
+        self.historico_var.set(" ".join(avisos))
+    
+    def valores_linha(self, gasto, deslocamentos):
+        """Valores e tags da linha de um lançamento na Treeview (deslocamentos: cache do saldo por ano)"""
+        data_formatada = datetime.strptime(gasto['data'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
+        projetado = gasto.get('projetado', False)
+        saldo = ''
+        if not projetado:
+            ano = gasto['data'][:4]
+            if ano not in deslocamentos:
+                deslocamentos[ano] = self.deslocamento_saldo(ano)
+            saldo = formatar_brl(self.indice_saldo.saldo_apos(gasto) + deslocamentos[ano], simbolo=False)
+        tags = ('projetado',) if projetado else ()
+        if e_receita(gasto):
+            tags += ('receita',)
+        return (
+            'Previsto' if projetado else gasto['id'],
+            data_formatada,
+            formatar_brl(gasto['valor'], simbolo=False),
+            saldo,
+            # Gasto dividido: todas as categorias, a principal primeiro
+            ' + '.join(sorted((c for c, _ in partes_lancamento(gasto)), key=lambda c: c != gasto['categoria'])),
+            gasto['descricao'],
+            ', '.join(gasto.get('tags', []))
+        ), tags
+    
+    def atualizar_linhas(self, ids, data_minima):
+        """Atualiza na Treeview só as linhas dos ids alterados e os saldos a partir de data_minima"""
+        atuais = {g['id']: g for g in self.gastos}
+        filtrada = self.lancamentos_exibidos is not None
+        if filtrada:
+            # A visualização filtrada mantém seus lançamentos, agora nas versões atuais
+            self.lancamentos_exibidos = [atuais[g['id']] for g in self.lancamentos_exibidos if g['id'] in atuais]
+        
+        datas = {str(i): g['data'] for i, g in atuais.items()}
+        deslocamentos = {}
+        novos = []
+        for id_lancamento in ids:
+            iid = str(id_lancamento)
+            existia = self.tree.exists(iid)
+            if existia:
+                self.tree.delete(iid)
+            gasto = atuais.get(id_lancamento)
+            if gasto is None or (filtrada and not existia):
+                continue
+            novos.append(gasto)
+        
+        # Linhas em ordem decrescente de data: cada uma entra antes da primeira mais antiga.
+        # Com as novas também ordenadas, uma única passada pela tabela acha todas as posições
+        novos.sort(key=lambda g: g['data'], reverse=True)
+        proximo = 0
+        for indice, item in enumerate(self.tree.get_children()):
+            if proximo == len(novos):
+                break
+            if item not in datas:
+                continue
+            while proximo < len(novos) and datas[item] < novos[proximo]['data']:
+                valores, tags = self.valores_linha(novos[proximo], deslocamentos)
+                self.tree.insert('', indice + proximo, iid=str(novos[proximo]['id']), values=valores, tags=tags)
+                proximo += 1
+        for gasto in novos[proximo:]:
+            valores, tags = self.valores_linha(gasto, deslocamentos)
+            self.tree.insert('', tk.END, iid=str(gasto['id']), values=valores, tags=tags)
+        
+        # O saldo muda em todas as linhas a partir do lançamento alterado mais antigo
+        for item in self.tree.get_children():
+            if item not in datas:
+                continue  # Lançamentos previstos não têm saldo
+            if datas[item] < data_minima:
+                break
+            valores, _ = self.valores_linha(atuais[int(item)], deslocamentos)
+            self.tree.set(item, 'saldo', valores[3])
+    
+    def registrar_versao_principal(self, assinatura):
+        """Guarda a versão do arquivo principal que está em memória"""
+        self.assinaturas_arquivos[self.arquivo_dados] = assinatura
+        self.bases_arquivos[self.arquivo_dados] = copy.deepcopy({
+            'limites': self.limites_categoria,
+            'recorrencias': {r['id']: r for r in self.recorrencias}
+        })
+    
+    def registrar_versao_particao(self, caminho, assinatura, gastos):
+        """Guarda a versão de uma partição que está em memória"""
+        self.assinaturas_arquivos[caminho] = assinatura
+        self.bases_arquivos[caminho] = {g['id']: resumo_lancamento(g) for g in gastos}
+    
+    @com_escrita
+    def recarregar_alteracoes_externas(self):
+        """Relê só os arquivos alterados por outro processo e os mescla com a memória.
+        
+        Devolve (ids alterados, data mínima afetada) ou None se nada mudou.
+        Arquivos ilegíveis (JSON inválido ou incompleto) são pulados antes de
+        qualquer alteração na memória e ficam em self.arquivos_ilegiveis; como
+        sua versão não é registrada, são tentados de novo na próxima verificação.
+        """
+        ids_alterados = set()
+        datas_afetadas = []
+        conflitos = 0
+        self.arquivos_ilegiveis = []
+        
+        # Primeiro só calcula: a memória muda de uma vez no fim, para uma falha não deixá-la pela metade
+        principal = None
+        particoes = []
+        
+        # Arquivo principal: limites, categorias, recorrências e metadados das partições
+        assinatura = assinatura_arquivo(self.arquivo_dados)
+        if assinatura is not None and assinatura != self.assinaturas_arquivos.get(self.arquivo_dados, assinatura):
+            try:
+                with open(self.arquivo_dados, 'r', encoding='utf-8') as f:
+                    dados = json.load(f)
+            except (OSError, ValueError):
+                self.arquivos_ilegiveis.append(self.arquivo_dados)
+                dados = None
+            if isinstance(dados, dict) and 'particoes' in dados:
+                if dados.get('unidade') != 'centavos':
+                    dados['limites'] = {c: centavos_de_reais(v) for c, v in dados.get('limites', {}).items()}
+                    converter_lancamentos_reais(dados.get('recorrencias', []))
+                    for meta in dados['particoes'].values():
+                        converter_resumo_reais(meta)
+                base = self.bases_arquivos.get(self.arquivo_dados, {'limites': {}, 'recorrencias': {}})
+                
+                limites, conflitos_limites = mesclar_tres_vias(
+                    base['limites'], self.limites_categoria, dados.get('limites', {})
+                )
+                recorrencias, conflitos_recorrencias = mesclar_tres_vias(
+                    base['recorrencias'], {r['id']: r for r in self.recorrencias},
+                    {r['id']: r for r in dados.get('recorrencias', [])}
+                )
+                conflitos += len(conflitos_limites) + len(conflitos_recorrencias)
+                
+                # Partições não carregadas ficam só com os metadados do outro processo
+                metadados = {a: m for a, m in self.particoes.items() if a in self.particoes_carregadas}
+                metadados.update((a, m) for a, m in dados['particoes'].items() if a not in self.particoes_carregadas)
+                
+                principal = (
+                    assinatura, limites, [recorrencias[i] for i in sorted(recorrencias)],
+                    list(dict.fromkeys(self.categorias_predefinidas + dados.get('categorias', []))), metadados,
+                    copy.deepcopy({
+                        'limites': dados.get('limites', {}),
+                        'recorrencias': {r['id']: r for r in dados.get('recorrencias', [])}
+                    })
+                )
+                ids_alterados.add(None)  # Marca que algo mudou, mesmo sem lançamentos
+        
+        # Partições carregadas: mescla lançamento a lançamento
+        proximo_id = self.proximo_id()
+        for ano in sorted(self.particoes_carregadas):
+            caminho = self.caminho_particao(ano)
+            assinatura = assinatura_arquivo(caminho)
+            if caminho not in self.assinaturas_arquivos or assinatura == self.assinaturas_arquivos[caminho]:
+                continue
+            
+            externo_lista = []
+            if assinatura is not None:
+                try:
+                    with open(caminho, 'r', encoding='utf-8') as f:
+                        particao = json.load(f)
+                except (OSError, ValueError):
+                    particao = None
+                if not isinstance(particao, dict):
+                    self.arquivos_ilegiveis.append(caminho)
+                    continue
+                externo_lista = particao.get('gastos', [])
+                if particao.get('unidade') != 'centavos':
+                    converter_lancamentos_reais(externo_lista)
+            externo = {g['id']: g for g in externo_lista}
+            base = self.bases_arquivos.get(caminho, {})
+            local = {g['id']: g for g in self.gastos if g['data'][:4] == ano}
+            
+            # O mesmo id criado nos dois lados: o lançamento externo recebe um id novo
+            proximo_id = max([proximo_id] + [i + 1 for i in externo])
+            for id_lancamento in [i for i in externo if i not in base and i in local and externo[i] != local[i]]:
+                externo[proximo_id] = dict(externo.pop(id_lancamento), id=proximo_id)
+                proximo_id += 1
+            
+            resultado, conflitos_ano = mesclar_tres_vias(base, local, externo, resumo_lancamento)
+            conflitos += len(conflitos_ano)
+            for id_lancamento in set(local) | set(resultado):
+                if local.get(id_lancamento) != resultado.get(id_lancamento):
+                    ids_alterados.add(id_lancamento)
+                    datas_afetadas.extend(g['data'] for g in (local.get(id_lancamento), resultado.get(id_lancamento)) if g)
+            
+            # Partição apagada ou esvaziada pelo outro processo: sem arquivo, fica sem metadados
+            particoes.append((
+                ano, caminho, assinatura, externo_lista, resultado,
+                self.resumir_particao(externo_lista) if externo_lista else None,
+                # Ainda há alterações locais a gravar se o resultado difere do arquivo
+                resultado != {g['id']: g for g in externo_lista}
             ))
+        
+        # Tudo calculado: aplica na memória
+        if principal:
+            (assinatura, self.limites_categoria, self.recorrencias, self.categorias_predefinidas,
+             self.particoes, base) = principal
+            self.assinaturas_arquivos[self.arquivo_dados] = assinatura
+            self.bases_arquivos[self.arquivo_dados] = base
+        for ano, caminho, assinatura, externo_lista, resultado, metadados, pendente in particoes:
+            self.gastos = [g for g in self.gastos if g['data'][:4] != ano] + [resultado[i] for i in sorted(resultado)]
+            self.registrar_versao_particao(caminho, assinatura, externo_lista)
+            if metadados:
+                self.particoes[ano] = metadados
+            else:
+                self.particoes.pop(ano, None)
+            if pendente:
+                self.particoes_alteradas.add(ano)
+            else:
+                self.particoes_alteradas.discard(ano)
+        
+        if conflitos:
+            # Depois de liberar a trava de escrita: com o aviso aberto, a API continua respondendo
+            mensagem = (f"Os dados foram alterados por outro programa. {conflitos} item(ns) alterados dos dois lados "
+                        "ficaram com a versão desta janela.")
+            self.root.after_idle(lambda: messagebox.showwarning("Alterações Externas", mensagem))
+        if not ids_alterados:
+            return None
+        
+        if datas_afetadas:
+            self.indice_saldo.reconstruir(self.gastos)
+            self.motor_analitico.reconstruir(self.gastos)
+            self.cubo_lancamentos.reconstruir(self.gastos)
+            self.indice_tags.reconstruir(self.gastos)
+        self.categoria_combobox['values'] = self.categorias_predefinidas
+        ids_alterados.discard(None)
+        return ids_alterados, min(datas_afetadas, default='9999')
+    
+    def verificar_alteracoes_externas(self, agendar=True):
+        """Verificação periódica de alterações externas nos arquivos da carteira ativa"""
+        try:
+            alteracoes = self.recarregar_alteracoes_externas()
+            if alteracoes:
+                ids, data_minima = alteracoes
+                self.atualizar_linhas(ids, data_minima)
+                self.atualizar_estatisticas()
+                self.atualizar_resumo_carteira()
+        except (OSError, ValueError):
+            pass  # Arquivo no meio de uma gravação externa: tenta de novo na próxima verificação
+        
+        if agendar:
+            self.root.after(self.intervalo_verificacao_arquivos_ms, self.verificar_alteracoes_externas)
     
+    @instrumentado
     def atualizar_estatisticas(self):
         """Atualiza as estatísticas exibidas"""
         hoje = datetime.now()
-        mes_atual = hoje.strftime('%m/%Y')
+        
+        agregados = self.agregados_historico()
         
         # Gastos do mês atual
-        gastos_mes = [
-            g for g in self.gastos 
-            if datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').strftime('%m/%Y') == mes_atual
-        ]
-        total_mes = sum(g['valor'] for g in gastos_mes)
-        self.total_mes_var.set(f"R$ {total_mes:,.2f}".replace('.', '|').replace(',', '.').replace('|', ','))
+        total_mes = agregados['meses'].get(hoje.strftime('%Y-%m'), 0)
+        self.total_mes_var.set(formatar_brl(total_mes))
+        
+        # Saldo e fluxo de caixa do mês pelo índice de somas de prefixo
+        saldo = self.indice_saldo.saldo_ate(hoje) + self.deslocamento_saldo(hoje.strftime('%Y'))
+        fluxo_mes = self.indice_saldo.fluxo(hoje.replace(day=1), hoje)
+        self.saldo_var.set(formatar_brl(saldo))
+        self.fluxo_mes_var.set(formatar_brl(fluxo_mes, sinal=True))
         
         # Maior gasto
-        if self.gastos:
-            maior_gasto = max(self.gastos, key=lambda x: x['valor'])
-            self.maior_gasto_var.set(
-                f"R$ {maior_gasto['valor']:,.2f} - {maior_gasto['categoria']}".replace('.', '|').replace(',', '.').replace('|', ',')
-            )
+        if agregados['maior']:
+            maior_gasto = agregados['maior']
+            self.maior_gasto_var.set(f"{formatar_brl(maior_gasto['valor'])} - {maior_gasto['categoria']}")
         else:
             self.maior_gasto_var.set("R$ 0,00 - Nenhum")
         
         # Categoria com mais gastos
-        if self.gastos:
-            categorias = defaultdict(float)
-            for g in self.gastos:
-                categorias[g['categoria']] += g['valor']
-            categoria_mais_gasto = max(categorias.items(), key=lambda x: x[1])[0]
+        if agregados['categorias']:
+            categoria_mais_gasto = max(agregados['categorias'].items(), key=lambda x: x[1])[0]
             self.categoria_mais_gasto_var.set(categoria_mais_gasto)
         else:
             self.categoria_mais_gasto_var.set("Nenhuma")
+        
+        # A previsão vem dos agregados incrementais, então pode acompanhar cada alteração
+        self.mostrar_analise()
     
     def editar_gasto(self):
         """Abre diálogo para editar gasto selecionado"""
@@ -416,14 +2576,17 @@ class GerenciadorGastosGUI:
             return
             
         item = self.tree.item(selecionado[0])
-        id_gasto = item['values'][0]
+        if 'projetado' in item['tags']:
+            messagebox.showwarning("Aviso", "Lançamentos previstos não podem ser editados. Edite a recorrência correspondente.")
+            return
+        id_gasto = int(selecionado[0])
         
         for gasto in self.gastos:
             if gasto['id'] == id_gasto:
                 # Janela de edição
                 edit_window = tk.Toplevel(self.root)
                 edit_window.title("Editar Gasto")
-                edit_window.geometry("400x350")
+                edit_window.geometry("400x420")
                 edit_window.transient(self.root)
                 edit_window.grab_set()
                 
@@ -432,34 +2595,51 @@ class GerenciadorGastosGUI:
                 edit_frame.pack(fill=tk.BOTH, expand=True)
                 
                 # Campos de edição
-                ttk.Label(edit_frame, text="Valor (R$):").grid(row=0, column=0, sticky="w", pady=5)
+                ttk.Label(edit_frame, text="Tipo:").grid(row=0, column=0, sticky="w", pady=5)
+                tipo_combobox = ttk.Combobox(edit_frame, values=['Despesa', 'Receita'], state='readonly', font=('Arial', 11))
+                tipo_combobox.current(1 if e_receita(gasto) else 0)
+                tipo_combobox.grid(row=0, column=1, sticky="ew", padx=5, pady=5)
+                
+                ttk.Label(edit_frame, text="Valor (R$):").grid(row=1, column=0, sticky="w", pady=5)
                 valor_entry = ttk.Entry(edit_frame, font=('Arial', 11))
-                valor_entry.insert(0, str(gasto['valor']))
-                valor_entry.grid(row=0, column=1, sticky="ew", padx=5, pady=5)
+                valor_entry.insert(0, formatar_brl(gasto['valor'], simbolo=False))
+                valor_entry.grid(row=1, column=1, sticky="ew", padx=5, pady=5)
                 
-                ttk.Label(edit_frame, text="Categoria:").grid(row=1, column=0, sticky="w", pady=5)
+                ttk.Label(edit_frame, text="Categoria:").grid(row=2, column=0, sticky="w", pady=5)
                 categoria_combobox = ttk.Combobox(edit_frame, values=self.categorias_predefinidas, font=('Arial', 11))
                 categoria_combobox.set(gasto['categoria'])
-                categoria_combobox.grid(row=1, column=1, sticky="ew", padx=5, pady=5)
+                categoria_combobox.grid(row=2, column=1, sticky="ew", padx=5, pady=5)
                 
-                ttk.Label(edit_frame, text="Data:").grid(row=2, column=0, sticky="w", pady=5)
+                ttk.Label(edit_frame, text="Data:").grid(row=3, column=0, sticky="w", pady=5)
                 data_entry = DateEntry(edit_frame, date_pattern='dd/mm/yyyy', font=('Arial', 11))
                 data_entry.set_date(datetime.strptime(gasto['data'], '%Y-%m-%d %H:%M:%S'))
-                data_entry.grid(row=2, column=1, sticky="ew", padx=5, pady=5)
+                data_entry.grid(row=3, column=1, sticky="ew", padx=5, pady=5)
                 
-                ttk.Label(edit_frame, text="Descrição:").grid(row=3, column=0, sticky="w", pady=5)
+                ttk.Label(edit_frame, text="Descrição:").grid(row=4, column=0, sticky="w", pady=5)
                 descricao_entry = ttk.Entry(edit_frame, font=('Arial', 11))
                 descricao_entry.insert(0, gasto['descricao'])
-                descricao_entry.grid(row=3, column=1, sticky="ew", padx=5, pady=5)
+                descricao_entry.grid(row=4, column=1, sticky="ew", padx=5, pady=5)
+                
+                ttk.Label(edit_frame, text="Tags:").grid(row=5, column=0, sticky="w", pady=5)
+                tags_entry = ttk.Entry(edit_frame, font=('Arial', 11))
+                tags_entry.insert(0, ', '.join(gasto.get('tags', [])))
+                tags_entry.grid(row=5, column=1, sticky="ew", padx=5, pady=5)
+                
+                ttk.Label(edit_frame, text="Divisão:").grid(row=6, column=0, sticky="w", pady=5)
+                divisao_entry = ttk.Entry(edit_frame, font=('Arial', 11))
+                divisao_entry.insert(0, formatar_divisoes(gasto.get('divisoes')))
+                divisao_entry.grid(row=6, column=1, sticky="ew", padx=5, pady=5)
                 
                 # Botões
                 btn_frame = ttk.Frame(edit_frame)
-                btn_frame.grid(row=4, column=0, columnspan=2, pady=10, sticky="ew")
+                btn_frame.grid(row=7, column=0, columnspan=2, pady=10, sticky="ew")
                 
                 ttk.Button(btn_frame, text="Salvar", style='Primary.TButton', 
                           command=lambda: self.salvar_edicao(
                               gasto, valor_entry.get(), categoria_combobox.get(),
-                              data_entry.get_date(), descricao_entry.get(), edit_window)
+                              data_entry.get_date(), descricao_entry.get(), edit_window,
+                              'receita' if tipo_combobox.get() == 'Receita' else 'despesa',
+                              tags_entry.get(), divisao_entry.get())
                           ).pack(side=tk.LEFT, padx=5, expand=True)
                 
                 ttk.Button(btn_frame, text="Cancelar", 
@@ -469,67 +2649,307 @@ class GerenciadorGastosGUI:
         
         messagebox.showerror("Erro", f"Gasto com ID {id_gasto} não encontrado!")
     
-    def salvar_edicao(self, gasto, novo_valor, nova_categoria, nova_data, nova_descricao, janela):
+    @instrumentado
+    def salvar_edicao(self, gasto, novo_valor, nova_categoria, nova_data, nova_descricao, janela, novo_tipo='despesa',
+                      novas_tags='', nova_divisao=''):
         """Salva as alterações do gasto editado"""
         try:
-            novo_valor = float(novo_valor.replace(',', '.'))
+            novo_valor = para_centavos(novo_valor)
             if novo_valor <= 0:
                 messagebox.showwarning("Aviso", "O valor deve ser positivo!")
                 return
-        except ValueError:
-            messagebox.showwarning("Aviso", "Valor inválido! Digite um número.")
-            return
+        except ValueError:
+            messagebox.showwarning("Aviso", "Valor inválido! Digite um número.")
+            return
+        
+        try:
+            divisoes = interpretar_divisoes(nova_divisao, novo_valor)
+        except ValueError as e:
+            messagebox.showwarning("Aviso", str(e), parent=janela)
+            return
+            
+        if not nova_categoria.strip() and not divisoes:
+            messagebox.showwarning("Aviso", "A categoria não pode ser vazia!")
+            return
+            
+        self.alterar_lancamento(
+            gasto, novo_valor, nova_categoria.strip(), nova_data.strftime('%Y-%m-%d %H:%M:%S'),
+            nova_descricao.strip(), novo_tipo, interpretar_tags(novas_tags), divisoes
+        )
+        
+        # Adicionar novas categorias se não existirem
+        self.registrar_categorias([nova_categoria] + [d['categoria'] for d in divisoes])
+        
+        self.salvar_dados()
+        self.atualizar_lista_gastos()
+        self.atualizar_estatisticas()
+        janela.destroy()
+        messagebox.showinfo("Sucesso", "Gasto atualizado com sucesso!")
+    
+    @com_escrita
+    def alterar_lancamento(self, gasto, valor, categoria, data, descricao, tipo, tags=None, divisoes=None):
+        """Altera um lançamento; os índices são refeitos só para ele"""
+        self.garantir_particoes({data[:4]})
+        self.particoes_alteradas.update({gasto['data'][:4], data[:4]})
+        self.indice_saldo.remover(gasto)
+        self.motor_analitico.remover(gasto)
+        self.cubo_lancamentos.remover(gasto)
+        self.indice_tags.remover(gasto)
+        gasto['valor'] = valor
+        gasto['categoria'] = categoria
+        gasto['descricao'] = descricao
+        gasto['data'] = data
+        gasto['tipo'] = tipo
+        classificar_lancamento(gasto, tags, divisoes)
+        self.indice_saldo.adicionar(gasto)
+        self.motor_analitico.adicionar(gasto)
+        self.cubo_lancamentos.adicionar(gasto)
+        self.indice_tags.adicionar(gasto)
+    
+    @instrumentado
+    def remover_gasto(self):
+        """Remove o gasto selecionado"""
+        selecionados = [item for item in self.tree.selection() if 'projetado' not in self.tree.item(item)['tags']]
+        if not selecionados:
+            messagebox.showwarning("Aviso", "Selecione um ou mais gastos para remover!")
+            return
+            
+        ids_gastos = {int(item) for item in selecionados}
+        total = sum(g['valor'] for g in self.gastos if g['id'] in ids_gastos)
+        
+        confirmacao = messagebox.askyesno(
+            "Confirmar", 
+            f"Tem certeza que deseja remover {len(ids_gastos)} gasto(s) selecionado(s) no total de {formatar_brl(total)}?"
+        )
+        
+        if confirmacao:
+            self.excluir_lancamentos(ids_gastos)
+            self.salvar_dados()
+            self.atualizar_lista_gastos()
+            self.atualizar_estatisticas()
+            messagebox.showinfo("Sucesso", f"{len(ids_gastos)} gasto(s) removido(s) com sucesso!")
+    
+    @instrumentado
+    def processar_recorrencias(self, agendar=True):
+        """Lança de uma só vez todas as ocorrências recorrentes vencidas"""
+        hoje = datetime.now()
+        proximo_id = self.proximo_id()
+        novos_gastos = []
+        
+        for regra in self.recorrencias:
+            ultima_data = None
+            for data in ocorrencias_recorrencia(regra, hoje):
+                novos_gastos.append({
+                    'id': proximo_id,
+                    'data': data.strftime('%Y-%m-%d %H:%M:%S'),
+                    'valor': regra['valor'],
+                    'categoria': regra['categoria'],
+                    'descricao': regra['descricao'],
+                    'tipo': regra.get('tipo', 'despesa'),
+                    'recorrencia': regra['id']
+                })
+                proximo_id += 1
+                ultima_data = data
+            
+            if ultima_data is not None:
+                regra['proxima'] = avancar_data_recorrencia(regra, ultima_data).strftime('%Y-%m-%d')
+        
+        # Um único salvamento para todo o lote
+        self.instrumentacao.registrar_linhas(len(novos_gastos))
+        if novos_gastos:
+            self.incluir_lancamentos(novos_gastos)
+            self.salvar_dados()
+            self.atualizar_lista_gastos()
+            self.atualizar_estatisticas()
+        
+        if agendar:
+            self.root.after(self.intervalo_recorrencias_ms, self.processar_recorrencias)
+        
+        return novos_gastos
+    
+    def processar_recorrencias_manual(self):
+        """Lança as recorrências pendentes sob demanda"""
+        novos_gastos = self.processar_recorrencias(agendar=False)
+        messagebox.showinfo("Recorrências", f"{len(novos_gastos)} lançamento(s) recorrente(s) registrado(s).")
+    
+    def projetar_recorrencias(self, ate):
+        """Retorna lançamentos futuros previstos (virtuais, não são salvos)"""
+        projetados = []
+        for regra in self.recorrencias:
+            for data in ocorrencias_recorrencia(regra, ate):
+                projetados.append({
+                    'id': None,
+                    'data': data.strftime('%Y-%m-%d %H:%M:%S'),
+                    'valor': regra['valor'],
+                    'categoria': regra['categoria'],
+                    'descricao': regra['descricao'],
+                    'tipo': regra.get('tipo', 'despesa'),
+                    'projetado': True
+                })
+        return projetados
+    
+    def mostrar_dialogo_recorrencias(self):
+        """Mostra diálogo para cadastrar e remover gastos recorrentes"""
+        rec_window = tk.Toplevel(self.root)
+        rec_window.title("Gastos Recorrentes")
+        rec_window.geometry("700x500")
+        rec_window.transient(self.root)
+        rec_window.grab_set()
+        
+        # Frame principal
+        rec_frame = ttk.Frame(rec_window, padding=10)
+        rec_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Lista de regras
+        columns = ('id', 'valor', 'categoria', 'descricao', 'frequencia', 'proxima', 'fim')
+        rec_tree = ttk.Treeview(rec_frame, columns=columns, show='headings', height=8)
+        for coluna, titulo, largura in [
+            ('id', 'ID', 40), ('valor', 'Valor (R$)', 80), ('categoria', 'Categoria', 100),
+            ('descricao', 'Descrição', 140), ('frequencia', 'Frequência', 110),
+            ('proxima', 'Próxima', 80), ('fim', 'Término', 80)
+        ]:
+            rec_tree.heading(coluna, text=titulo)
+            rec_tree.column(coluna, width=largura, anchor='center')
+        rec_tree.grid(row=0, column=0, columnspan=2, sticky="nsew", pady=5)
+        
+        def atualizar_lista_regras():
+            for item in rec_tree.get_children():
+                rec_tree.delete(item)
+            for regra in self.recorrencias:
+                frequencia = FREQUENCIAS_RECORRENCIA[regra['frequencia']]
+                if regra.get('intervalo', 1) > 1 or regra['frequencia'] == 'dias':
+                    frequencia += f" ({regra.get('intervalo', 1)})"
+                rec_tree.insert('', tk.END, iid=str(regra['id']), values=(
+                    regra['id'],
+                    formatar_brl(regra['valor'], simbolo=False),
+                    regra['categoria'],
+                    regra['descricao'],
+                    frequencia,
+                    datetime.strptime(regra['proxima'], '%Y-%m-%d').strftime('%d/%m/%Y'),
+                    datetime.strptime(regra['fim'], '%Y-%m-%d').strftime('%d/%m/%Y') if regra.get('fim') else '-'
+                ))
+        
+        atualizar_lista_regras()
+        
+        # Campos da nova regra
+        ttk.Label(rec_frame, text="Valor (R$):").grid(row=1, column=0, sticky="w", pady=2)
+        valor_entry = ttk.Entry(rec_frame)
+        valor_entry.grid(row=1, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(rec_frame, text="Categoria:").grid(row=2, column=0, sticky="w", pady=2)
+        categoria_combobox = ttk.Combobox(rec_frame, values=self.categorias_predefinidas)
+        categoria_combobox.grid(row=2, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(rec_frame, text="Descrição:").grid(row=3, column=0, sticky="w", pady=2)
+        descricao_entry = ttk.Entry(rec_frame)
+        descricao_entry.grid(row=3, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(rec_frame, text="Frequência:").grid(row=4, column=0, sticky="w", pady=2)
+        frequencia_combobox = ttk.Combobox(rec_frame, values=list(FREQUENCIAS_RECORRENCIA.values()), state='readonly')
+        frequencia_combobox.current(0)
+        frequencia_combobox.grid(row=4, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(rec_frame, text="Intervalo (N):").grid(row=5, column=0, sticky="w", pady=2)
+        intervalo_entry = ttk.Entry(rec_frame)
+        intervalo_entry.insert(0, "1")
+        intervalo_entry.grid(row=5, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(rec_frame, text="Início:").grid(row=6, column=0, sticky="w", pady=2)
+        inicio_entry = DateEntry(rec_frame, date_pattern='dd/mm/yyyy')
+        inicio_entry.grid(row=6, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(rec_frame, text="Término (DD/MM/AAAA, opcional):").grid(row=7, column=0, sticky="w", pady=2)
+        fim_entry = ttk.Entry(rec_frame)
+        fim_entry.grid(row=7, column=1, sticky="ew", padx=5, pady=2)
+        
+        ttk.Label(rec_frame, text="Tipo:").grid(row=8, column=0, sticky="w", pady=2)
+        tipo_combobox = ttk.Combobox(rec_frame, values=['Despesa', 'Receita'], state='readonly')
+        tipo_combobox.current(0)
+        tipo_combobox.grid(row=8, column=1, sticky="ew", padx=5, pady=2)
+        
+        def adicionar_regra():
+            try:
+                valor = para_centavos(valor_entry.get())
+                intervalo = int(intervalo_entry.get())
+                if valor <= 0 or intervalo <= 0:
+                    messagebox.showwarning("Aviso", "Valor e intervalo devem ser positivos!", parent=rec_window)
+                    return
+            except ValueError:
+                messagebox.showwarning("Aviso", "Valor ou intervalo inválido! Digite um número.", parent=rec_window)
+                return
             
-        if not nova_categoria.strip():
-            messagebox.showwarning("Aviso", "A categoria não pode ser vazia!")
-            return
+            categoria = categoria_combobox.get().strip()
+            if not categoria:
+                messagebox.showwarning("Aviso", "A categoria não pode ser vazia!", parent=rec_window)
+                return
             
-        # Atualizar gasto
-        gasto['valor'] = novo_valor
-        gasto['categoria'] = nova_categoria.strip()
-        gasto['descricao'] = nova_descricao.strip()
-        gasto['data'] = nova_data.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Adicionar nova categoria se não existir
-        if nova_categoria not in self.categorias_predefinidas:
-            self.categorias_predefinidas.append(nova_categoria)
-            self.categorias_predefinidas.sort()
-            self.categoria_combobox['values'] = self.categorias_predefinidas
+            fim = None
+            if fim_entry.get().strip():
+                try:
+                    fim = datetime.strptime(fim_entry.get().strip(), '%d/%m/%Y').strftime('%Y-%m-%d')
+                except ValueError:
+                    messagebox.showerror("Erro", "Formato de data inválido! Use DD/MM/AAAA.", parent=rec_window)
+                    return
+            
+            frequencia = list(FREQUENCIAS_RECORRENCIA)[frequencia_combobox.current()]
+            inicio = inicio_entry.get_date().strftime('%Y-%m-%d')
+            self.recorrencias.append({
+                'id': max([r['id'] for r in self.recorrencias] + [0]) + 1,
+                'valor': valor,
+                'categoria': categoria,
+                'descricao': descricao_entry.get().strip(),
+                'frequencia': frequencia,
+                'intervalo': intervalo,
+                'inicio': inicio,
+                'fim': fim,
+                'proxima': inicio,
+                'tipo': 'receita' if tipo_combobox.get() == 'Receita' else 'despesa'
+            })
+            
+            if categoria not in self.categorias_predefinidas:
+                self.categorias_predefinidas.append(categoria)
+                self.categorias_predefinidas.sort()
+                self.categoria_combobox['values'] = self.categorias_predefinidas
+            
+            # Lança ocorrências já vencidas (início no passado) em um único salvamento
+            if not self.processar_recorrencias(agendar=False):
+                self.salvar_dados()
+            atualizar_lista_regras()
+            if self.mostrar_projecoes_var.get():
+                self.atualizar_lista_gastos()
         
-        self.salvar_dados()
-        self.atualizar_lista_gastos()
-        self.atualizar_estatisticas()
-        janela.destroy()
-        messagebox.showinfo("Sucesso", "Gasto atualizado com sucesso!")
-    
-    def remover_gasto(self):
-        """Remove o gasto selecionado"""
-        selecionados = self.tree.selection()
-        if not selecionados:
-            messagebox.showwarning("Aviso", "Selecione um ou mais gastos para remover!")
-            return
+        def remover_regra():
+            selecionados = rec_tree.selection()
+            if not selecionados:
+                messagebox.showwarning("Aviso", "Selecione uma recorrência para remover!", parent=rec_window)
+                return
             
-        ids_gastos = [self.tree.item(item)['values'][0] for item in selecionados]
-        total = sum(float(self.tree.item(item)['values'][2].replace('.', '').replace(',', '.')) 
-                   for item in selecionados)
+            ids_regras = [int(item) for item in selecionados]
+            if messagebox.askyesno("Confirmar", "Remover as recorrências selecionadas?\n"
+                                   "Os gastos já lançados serão mantidos.", parent=rec_window):
+                self.recorrencias = [r for r in self.recorrencias if r['id'] not in ids_regras]
+                self.salvar_dados()
+                atualizar_lista_regras()
+                self.atualizar_lista_gastos()
         
-        confirmacao = messagebox.askyesno(
-            "Confirmar", 
-            f"Tem certeza que deseja remover {len(ids_gastos)} gasto(s) selecionado(s) no total de R$ {total:,.2f}?"
-        )
+        # Botões
+        btn_frame = ttk.Frame(rec_frame)
+        btn_frame.grid(row=9, column=0, columnspan=2, pady=10, sticky="ew")
         
-        if confirmacao:
-            self.gastos = [g for g in self.gastos if g['id'] not in ids_gastos]
-            self.salvar_dados()
-            self.atualizar_lista_gastos()
-            self.atualizar_estatisticas()
-            messagebox.showinfo("Sucesso", f"{len(ids_gastos)} gasto(s) removido(s) com sucesso!")
+        ttk.Button(btn_frame, text="Adicionar Recorrência", style='Primary.TButton',
+                  command=adicionar_regra).pack(side=tk.LEFT, padx=5, expand=True)
+        ttk.Button(btn_frame, text="Remover Selecionada", style='Secondary.TButton',
+                  command=remover_regra).pack(side=tk.LEFT, padx=5, expand=True)
+        ttk.Button(btn_frame, text="Fechar", command=rec_window.destroy).pack(side=tk.LEFT, padx=5, expand=True)
+        
+        rec_frame.columnconfigure(1, weight=1)
+        rec_frame.rowconfigure(0, weight=1)
     
     def mostrar_dialogo_filtro(self):
         """Mostra diálogo com opções de filtro"""
         filter_window = tk.Toplevel(self.root)
         filter_window.title("Filtrar Gastos")
-        filter_window.geometry("400x300")
+        filter_window.geometry("400x450")
         filter_window.transient(self.root)
         filter_window.grab_set()
         
@@ -544,6 +2964,9 @@ class GerenciadorGastosGUI:
         self.filtro_valor_max_var = tk.StringVar()
         self.filtro_data_inicio_var = tk.StringVar()
         self.filtro_data_fim_var = tk.StringVar()
+        self.filtro_tags_todas_var = tk.StringVar()
+        self.filtro_tags_alguma_var = tk.StringVar()
+        self.filtro_tags_nenhuma_var = tk.StringVar()
         
         # Widgets de filtro
         ttk.Label(filter_frame, text="Categoria:").grid(row=0, column=0, sticky="w", pady=5)
@@ -570,80 +2993,106 @@ class GerenciadorGastosGUI:
                                  date_pattern='dd/mm/yyyy')
         data_fim_entry.grid(row=5, column=1, sticky="ew", padx=5, pady=5)
         
+        # Tags separadas por vírgula: todas (E), alguma (OU) e nenhuma (NÃO)
+        ttk.Label(filter_frame, text="Com todas as tags:").grid(row=6, column=0, sticky="w", pady=5)
+        ttk.Entry(filter_frame, textvariable=self.filtro_tags_todas_var).grid(row=6, column=1, sticky="ew", padx=5, pady=5)
+        
+        ttk.Label(filter_frame, text="Com alguma das tags:").grid(row=7, column=0, sticky="w", pady=5)
+        ttk.Entry(filter_frame, textvariable=self.filtro_tags_alguma_var).grid(row=7, column=1, sticky="ew", padx=5, pady=5)
+        
+        ttk.Label(filter_frame, text="Sem as tags:").grid(row=8, column=0, sticky="w", pady=5)
+        ttk.Entry(filter_frame, textvariable=self.filtro_tags_nenhuma_var).grid(row=8, column=1, sticky="ew", padx=5, pady=5)
+        
+        tags_existentes = self.indice_tags.tags()
+        ttk.Label(filter_frame, text=f"Tags em uso: {', '.join(tags_existentes) if tags_existentes else 'nenhuma'}",
+                  wraplength=360, foreground='#888888').grid(row=9, column=0, columnspan=2, sticky="w", pady=5)
+        
         # Botões
         btn_frame = ttk.Frame(filter_frame)
-        btn_frame.grid(row=6, column=0, columnspan=2, pady=10, sticky="ew")
+        btn_frame.grid(row=10, column=0, columnspan=2, pady=10, sticky="ew")
         
         ttk.Button(btn_frame, text="Aplicar Filtros", style='Primary.TButton',
                   command=lambda: self.aplicar_filtros(filter_window)).pack(side=tk.LEFT, padx=5, expand=True)
         
         ttk.Button(btn_frame, text="Cancelar", command=filter_window.destroy).pack(side=tk.LEFT, padx=5, expand=True)
     
+    @instrumentado
     def aplicar_filtros(self, janela):
         """Aplica os filtros selecionados"""
-        gastos_filtrados = self.gastos
+        # Carregar apenas as partições anuais que o filtro pode alcançar
+        mes = self.filtro_mes_var.get()
+        data_inicio = self.filtro_data_inicio_var.get()
+        data_fim = self.filtro_data_fim_var.get()
+        anos = None
+        try:
+            if mes:
+                anos = {f"{int(mes.split('/')[1]):04d}"}
+            elif data_inicio or data_fim:
+                ano_inicio = int(data_inicio[-4:]) if data_inicio else int(min(list(self.particoes) + ['9999']))
+                ano_fim = int(data_fim[-4:]) if data_fim else datetime.now().year
+                anos = {f"{ano:04d}" for ano in range(ano_inicio, ano_fim + 1)}
+        except (ValueError, IndexError):
+            anos = set()  # Formato inválido: o erro é informado abaixo
+        self.garantir_particoes(anos)
         
-        # Filtro por categoria
-        categoria = self.filtro_categoria_var.get()
-        if categoria:
-            gastos_filtrados = [g for g in gastos_filtrados if g['categoria'].lower() == categoria.lower()]
+        # Validar todos os critérios antes de percorrer os lançamentos
+        categoria = self.filtro_categoria_var.get().lower()
         
-        # Filtro por mês/ano
-        mes = self.filtro_mes_var.get()
+        # Filtro por mês/ano: 'MM/AAAA' vira o prefixo 'AAAA-MM' da data gravada
+        prefixo_mes = None
         if mes:
             try:
                 mes_num, ano = map(int, mes.split('/'))
-                gastos_filtrados = [
-                    g for g in gastos_filtrados 
-                    if datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').month == mes_num
-                    and datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').year == ano
-                ]
+                prefixo_mes = f"{ano:04d}-{mes_num:02d}"
             except ValueError:
                 messagebox.showerror("Erro", "Formato de mês inválido! Use MM/AAAA.")
                 return
         
-        # Filtro por valor mínimo
         valor_min = self.filtro_valor_min_var.get()
         if valor_min:
             try:
-                valor_min = float(valor_min.replace(',', '.'))
-                gastos_filtrados = [g for g in gastos_filtrados if g['valor'] >= valor_min]
+                valor_min = para_centavos(valor_min)
             except ValueError:
                 messagebox.showerror("Erro", "Valor mínimo inválido! Digite um número.")
                 return
         
-        # Filtro por valor máximo
         valor_max = self.filtro_valor_max_var.get()
         if valor_max:
             try:
-                valor_max = float(valor_max.replace(',', '.'))
-                gastos_filtrados = [g for g in gastos_filtrados if g['valor'] <= valor_max]
+                valor_max = para_centavos(valor_max)
             except ValueError:
                 messagebox.showerror("Erro", "Valor máximo inválido! Digite um número.")
                 return
         
-        # Filtro por período
-        data_inicio = self.filtro_data_inicio_var.get()
-        data_fim = self.filtro_data_fim_var.get()
-        if data_inicio or data_fim:
-            try:
-                if data_inicio:
-                    inicio = datetime.strptime(data_inicio, '%d/%m/%Y')
-                    gastos_filtrados = [
-                        g for g in gastos_filtrados 
-                        if datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S') >= inicio
-                    ]
-                
-                if data_fim:
-                    fim = datetime.strptime(data_fim, '%d/%m/%Y') + timedelta(days=1)
-                    gastos_filtrados = [
-                        g for g in gastos_filtrados 
-                        if datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S') <= fim
-                    ]
-            except ValueError:
-                messagebox.showerror("Erro", "Formato de data inválido! Use DD/MM/AAAA.")
-                return
+        # Filtro por período, comparando as datas como texto no formato gravado
+        try:
+            inicio = datetime.strptime(data_inicio, '%d/%m/%Y').strftime('%Y-%m-%d %H:%M:%S') if data_inicio else None
+            fim = (datetime.strptime(data_fim, '%d/%m/%Y') + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S') if data_fim else None
+        except ValueError:
+            messagebox.showerror("Erro", "Formato de data inválido! Use DD/MM/AAAA.")
+            return
+        
+        # Tags: a consulta E/OU/NÃO é resolvida e decodificada uma vez; cada lançamento só consulta um conjunto
+        tags_todas = interpretar_tags(self.filtro_tags_todas_var.get())
+        tags_alguma = interpretar_tags(self.filtro_tags_alguma_var.get())
+        tags_nenhuma = interpretar_tags(self.filtro_tags_nenhuma_var.get())
+        ids_tags = None
+        if tags_todas or tags_alguma or tags_nenhuma:
+            ids_tags = self.indice_tags.ids(self.indice_tags.consultar(tags_todas, tags_alguma, tags_nenhuma))
+        
+        # Uma única passada, sem listas intermediárias; um gasto dividido vale para cada uma das suas categorias
+        gastos_filtrados = [
+            g for g in self.gastos
+            if (ids_tags is None or g['id'] in ids_tags)
+            and (not categoria or any(c.lower() == categoria for c, _ in partes_lancamento(g)))
+            and (not prefixo_mes or g['data'].startswith(prefixo_mes))
+            and (not valor_min or g['valor'] >= valor_min)
+            and (not valor_max or g['valor'] <= valor_max)
+            and (not inicio or g['data'] >= inicio)
+            and (not fim or g['data'] <= fim)
+        ]
         
+        self.instrumentacao.registrar_linhas(len(gastos_filtrados))
         self.atualizar_lista_gastos(gastos_filtrados)
         janela.destroy()
         messagebox.showinfo("Filtros", f"{len(gastos_filtrados)} gastos encontrados com os filtros aplicados.")
@@ -653,22 +3102,21 @@ class GerenciadorGastosGUI:
         self.atualizar_lista_gastos()
         messagebox.showinfo("Filtros", "Todos os filtros foram removidos.")
     
+    @instrumentado
     def mostrar_resumo(self):
         """Mostra resumo completo dos gastos"""
         hoje = datetime.now()
         mes_atual = hoje.strftime('%m/%Y')
         mes_passado = (hoje.replace(day=1) - timedelta(days=1)).strftime('%m/%Y')
         
-        # Calcular totais
-        total_geral = sum(g['valor'] for g in self.gastos)
-        total_mes = sum(
-            g['valor'] for g in self.gastos 
-            if datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').strftime('%m/%Y') == mes_atual
-        )
-        total_mes_passado = sum(
-            g['valor'] for g in self.gastos 
-            if datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').strftime('%m/%Y') == mes_passado
-        )
+        # Calcular totais (partições antigas entram pelos metadados, sem serem carregadas)
+        agregados = self.agregados_historico()
+        total_geral = agregados['total']
+        total_receitas = agregados['receitas']
+        total_mes = agregados['meses'].get(hoje.strftime('%Y-%m'), 0)
+        total_mes_passado = agregados['meses'].get(f"{mes_passado[3:]}-{mes_passado[:2]}", 0)
+        saldo = self.indice_saldo.saldo_ate(hoje) + self.deslocamento_saldo(hoje.strftime('%Y'))
+        fluxo_mes = self.indice_saldo.fluxo(hoje.replace(day=1), hoje)
         
         # Calcular variação mensal
         if total_mes_passado > 0:
@@ -678,15 +3126,16 @@ class GerenciadorGastosGUI:
             texto_variacao = "Dados insuficientes para comparação"
         
         # Calcular por categoria
-        categorias = defaultdict(float)
-        for g in self.gastos:
-            categorias[g['categoria']] += g['valor']
+        categorias = agregados['categorias']
         
         # Gerar texto do resumo
         resumo_texto = f"=== RESUMO FINANCEIRO ===\n\n"
-        resumo_texto += f"Total Geral: R$ {total_geral:,.2f}\n"
-        resumo_texto += f"Total Mês Atual ({mes_atual}): R$ {total_mes:,.2f}\n"
+        resumo_texto += f"Total Geral: {formatar_brl(total_geral)}\n"
+        resumo_texto += f"Total Mês Atual ({mes_atual}): {formatar_brl(total_mes)}\n"
         resumo_texto += f"  → {texto_variacao}\n\n"
+        resumo_texto += f"Receitas: {formatar_brl(total_receitas)}\n"
+        resumo_texto += f"Saldo Atual: {formatar_brl(saldo)}\n"
+        resumo_texto += f"Fluxo de Caixa do Mês: {formatar_brl(fluxo_mes, sinal=True)}\n\n"
         resumo_texto += "=== GASTOS POR CATEGORIA ===\n\n"
         
         for categoria, total in sorted(categorias.items(), key=lambda x: x[1], reverse=True):
@@ -696,11 +3145,17 @@ class GerenciadorGastosGUI:
             if limite:
                 percentual_limite = (total / limite) * 100
                 resumo_texto += (
-                    f"{categoria}: R$ {total:,.2f} ({percentual:.1f}% do total) | "
-                    f"Limite: R$ {limite:,.2f} ({percentual_limite:.1f}%)\n"
+                    f"{categoria}: {formatar_brl(total)} ({percentual:.1f}% do total) | "
+                    f"Limite: {formatar_brl(limite)} ({percentual_limite:.1f}%)\n"
                 )
             else:
-                resumo_texto += f"{categoria}: R$ {total:,.2f} ({percentual:.1f}% do total)\n"
+                resumo_texto += f"{categoria}: {formatar_brl(total)} ({percentual:.1f}% do total)\n"
+        
+        # Tags podem se sobrepor (um gasto com várias tags conta em cada uma), então não há percentual do total
+        if agregados['tags']:
+            resumo_texto += "\n=== GASTOS POR TAG ===\n\n"
+            for tag, total in sorted(agregados['tags'].items(), key=lambda x: x[1], reverse=True):
+                resumo_texto += f"{tag}: {formatar_brl(total)}\n"
         
         # Exibir no widget de texto
         self.resumo_text.config(state=tk.NORMAL)
@@ -708,6 +3163,113 @@ class GerenciadorGastosGUI:
         self.resumo_text.insert(tk.END, resumo_texto)
         self.resumo_text.config(state=tk.DISABLED)
     
+    @instrumentado
+    def mostrar_analise(self):
+        """Mostra a previsão de fim de mês por categoria e os gastos incomuns recentes"""
+        hoje = datetime.now()
+        previsoes = self.motor_analitico.previsoes(hoje)
+        
+        texto = f"=== PREVISÃO PARA O FIM DE {hoje.strftime('%m/%Y')} ===\n\n"
+        if not previsoes:
+            texto += "Sem gastos suficientes para prever.\n"
+        for categoria, previsao in sorted(previsoes.items(), key=lambda x: x[1]['previsto'], reverse=True):
+            texto += f"{categoria}: {formatar_brl(previsao['previsto'])} (até agora {formatar_brl(previsao['acumulado'])}"
+            if previsao['media'] is not None:
+                texto += f", média {formatar_brl(previsao['media'])}"
+            texto += ")\n"
+            limite = self.limites_categoria.get(categoria)
+            if limite and previsao['previsto'] > limite:
+                texto += f"  ⚠ Deve ultrapassar o limite de {formatar_brl(limite)}\n"
+        
+        inicio = (hoje - timedelta(days=self.dias_anomalias)).strftime('%Y-%m-%d')
+        recentes = self.motor_analitico.recentes(inicio)
+        anomalias = self.motor_analitico.anomalias(recentes, self.limiar_anomalia)
+        
+        texto += f"\n=== GASTOS INCOMUNS (ÚLTIMOS {self.dias_anomalias} DIAS) ===\n\n"
+        if not anomalias:
+            texto += "Nenhum gasto fora do padrão.\n"
+        for gasto, escore in anomalias:
+            data = datetime.strptime(gasto['data'][:10], '%Y-%m-%d').strftime('%d/%m/%Y')
+            texto += f"{data} {gasto['categoria']}: {formatar_brl(gasto['valor'])} - {gasto['descricao']} (escore {escore:.1f})\n"
+        
+        self.previsao_text.config(state=tk.NORMAL)
+        self.previsao_text.delete(1.0, tk.END)
+        self.previsao_text.insert(tk.END, texto)
+        self.previsao_text.config(state=tk.DISABLED)
+    
+    def mostrar_construtor_relatorios(self):
+        """Mostra o construtor de relatórios dinâmicos (tabela dinâmica)"""
+        # O relatório cobre todo o histórico: os anos ficam reservados enquanto a janela estiver aberta
+        anos = set(self.particoes)
+        self.reservar_particoes(anos)
+        
+        janela = tk.Toplevel(self.root)
+        janela.title("Construtor de Relatórios")
+        janela.geometry("800x500")
+        janela.transient(self.root)
+        
+        def fechar():
+            self.liberar_reserva_particoes(anos)
+            janela.destroy()
+        janela.protocol("WM_DELETE_WINDOW", fechar)
+        
+        opcoes_frame = ttk.Frame(janela, padding=10)
+        opcoes_frame.pack(side=tk.LEFT, fill=tk.Y)
+        
+        ttk.Label(opcoes_frame, text="Agrupar por:", font=('Arial', 10, 'bold')).pack(anchor=tk.W, pady=(0, 5))
+        dimensoes_vars = {}
+        for dimensao, rotulo in DIMENSOES_RELATORIO.items():
+            dimensoes_vars[dimensao] = tk.BooleanVar(value=dimensao == 'categoria')
+            ttk.Checkbutton(opcoes_frame, text=rotulo, variable=dimensoes_vars[dimensao]).pack(anchor=tk.W)
+        
+        ttk.Label(opcoes_frame, text="Lançamentos:", font=('Arial', 10, 'bold')).pack(anchor=tk.W, pady=(10, 5))
+        tipo_var = tk.StringVar(value="Despesas")
+        ttk.Combobox(opcoes_frame, textvariable=tipo_var, values=["Despesas", "Receitas", "Todos"],
+                     state="readonly", width=15).pack(anchor=tk.W)
+        
+        tabela_frame = ttk.Frame(janela, padding=10)
+        tabela_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        tabela = ttk.Treeview(tabela_frame, show='headings')
+        scrollbar = ttk.Scrollbar(tabela_frame, orient=tk.VERTICAL, command=tabela.yview)
+        tabela.configure(yscrollcommand=scrollbar.set)
+        tabela.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        def rotulo(dimensao, valor):
+            if dimensao == 'dia_semana':
+                return DIAS_SEMANA[valor]
+            if dimensao == 'faixa':
+                return rotulo_faixa(valor)
+            if dimensao == 'tipo':
+                return valor.capitalize()
+            return valor
+        
+        def gerar():
+            dimensoes = [d for d in DIMENSOES_RELATORIO if dimensoes_vars[d].get()]
+            filtro = {'Despesas': {'tipo': 'despesa'}, 'Receitas': {'tipo': 'receita'}}.get(tipo_var.get())
+            self.garantir_particoes()  # Só lê o que ainda faltar (outra carteira, ano novo)
+            with self.instrumentacao.medir('relatorio_dinamico'):
+                cubo = self.cubo_lancamentos.consultar(dimensoes, filtro)
+            
+            colunas = dimensoes + ['soma', 'quantidade', 'media', 'maximo']
+            tabela['columns'] = colunas
+            titulos = dict(DIMENSOES_RELATORIO, soma='Soma', quantidade='Qtde', media='Média', maximo='Máximo')
+            for coluna in colunas:
+                tabela.heading(coluna, text=titulos[coluna])
+                tabela.column(coluna, width=100, anchor=tk.E if coluna in ('soma', 'quantidade', 'media', 'maximo') else tk.W)
+            
+            tabela.delete(*tabela.get_children())
+            for chave, (soma, quantidade, maximo) in sorted(cubo.items()):
+                tabela.insert('', tk.END, values=[rotulo(d, v) for d, v in zip(dimensoes, chave)] + [
+                    formatar_brl(soma), quantidade, formatar_brl(round(soma / quantidade)), formatar_brl(maximo)
+                ])
+        
+        ttk.Button(opcoes_frame, text="Gerar", style='Primary.TButton', command=gerar).pack(fill=tk.X, pady=(15, 5))
+        ttk.Button(opcoes_frame, text="Fechar", command=fechar).pack(fill=tk.X)
+        gerar()
+    
+    @instrumentado
     def gerar_graficos(self):
         """Gera e exibe gráficos de análise"""
         # Limpar frame de gráficos
@@ -717,34 +3279,60 @@ class GerenciadorGastosGUI:
         # Obter período para filtro
         periodo = simpledialog.askstring("Período", "Digite o mês/ano (MM/AAAA) ou deixe em branco para todos:")
         
-        # Filtrar gastos por período
-        gastos_filtrados = self.gastos
+        # Calcular dados para gráficos (receitas não entram nos gráficos de gastos)
+        categorias = defaultdict(int)
+        meses = defaultdict(int)
         if periodo:
             try:
                 mes, ano = map(int, periodo.split('/'))
+                self.garantir_particoes({f"{ano:04d}"})
                 gastos_filtrados = [
                     g for g in self.gastos 
-                    if datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').month == mes
+                    if not e_receita(g)
+                    and datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').month == mes
                     and datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').year == ano
                 ]
             except ValueError:
                 messagebox.showerror("Erro", "Formato inválido! Use MM/AAAA.")
                 return
+            
+            for g in gastos_filtrados:
+                data = datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S')
+                for categoria, valor in partes_lancamento(g):
+                    categorias[categoria] += valor
+                meses[data.strftime('%m/%Y')] += g['valor']
+        else:
+            # Todo o histórico a partir dos agregados das partições
+            agregados = self.agregados_historico()
+            categorias = agregados['categorias']
+            for mes, total in agregados['meses'].items():
+                meses[f"{mes[5:]}/{mes[:4]}"] += total
         
-        if not gastos_filtrados:
+        if not categorias:
             messagebox.showinfo("Info", "Nenhum dado para exibir no período selecionado.")
             return
         
-        # Calcular dados para gráficos
-        categorias = defaultdict(float)
-        meses = defaultdict(float)
-        for g in gastos_filtrados:
-            data = datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S')
-            categorias[g['categoria']] += g['valor']
-            meses[data.strftime('%m/%Y')] += g['valor']
+        # A figura anterior sai do registro do pyplot junto com o widget
+        if self.graficos_exibidos:
+            plt.close(self.graficos_exibidos[3])
+        fig = self.desenhar_graficos(categorias, meses)
+        self.graficos_exibidos = (periodo or 'todos', categorias, meses, fig)
+        
+        # Exibir gráficos na interface
+        canvas = FigureCanvasTkAgg(fig, master=self.graph_frame)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
+        # Adicionar botão para salvar gráficos
+        ttk.Button(
+            self.graph_frame, text="Salvar Gráficos", style='Primary.TButton',
+            command=self.salvar_graficos
+        ).pack(pady=5)
+    
+    def desenhar_graficos(self, categorias, meses):
+        """Monta a figura com os gráficos de categorias e de evolução mensal"""
         # Criar figura com subplots
-        fig = plt.figure(figsize=(10, 8), tight_layout=True)
+        fig = plt.figure(figsize=self.tamanho_graficos, tight_layout=True)
         
         # Gráfico 1: Pizza de categorias
         ax1 = fig.add_subplot(2, 2, 1)
@@ -758,19 +3346,19 @@ class GerenciadorGastosGUI:
         )
         ax1.set_title('Distribuição por Categoria')
         
-        # Gráfico 2: Barras de categorias
+        # Gráfico 2: Barras de categorias (eixo em reais, rótulos formatados a partir dos centavos)
         ax2 = fig.add_subplot(2, 2, 2)
-        bars = ax2.bar(categorias_ordenadas.keys(), categorias_ordenadas.values(), color='skyblue')
+        bars = ax2.bar(categorias_ordenadas.keys(), [v / 100 for v in categorias_ordenadas.values()], color='skyblue')
         ax2.set_title('Gastos por Categoria')
         ax2.tick_params(axis='x', rotation=45)
         ax2.set_ylabel('Valor (R$)')
         
         # Adicionar valores nas barras
-        for bar in bars:
+        for bar, centavos in zip(bars, categorias_ordenadas.values()):
             height = bar.get_height()
             ax2.text(
                 bar.get_x() + bar.get_width()/2., height,
-                f'R${height:,.2f}',
+                formatar_brl(centavos),
                 ha='center', va='bottom', fontsize=8
             )
         
@@ -781,27 +3369,33 @@ class GerenciadorGastosGUI:
             meses_labels = [m[0] for m in meses_ordenados]
             meses_valores = [m[1] for m in meses_ordenados]
             
-            ax3.plot(meses_labels, meses_valores, marker='o', linestyle='-', color='green')
+            ax3.plot(meses_labels, [v / 100 for v in meses_valores], marker='o', linestyle='-', color='green')
             ax3.set_title('Evolução Mensal')
             ax3.set_ylabel('Valor (R$)')
             ax3.grid(True)
             
             # Adicionar valores nos pontos
             for i, v in enumerate(meses_valores):
-                ax3.text(i, v, f"R${v:,.2f}", ha='center', va='bottom', fontsize=8)
+                ax3.text(i, v / 100, formatar_brl(v), ha='center', va='bottom', fontsize=8)
         
-        # Exibir gráficos na interface
-        canvas = FigureCanvasTkAgg(fig, master=self.graph_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        return fig
+    
+    def renderizar_graficos(self, periodo, categorias, meses, formato='png'):
+        """Imagem dos gráficos em alta resolução, reaproveitada enquanto os dados não mudarem"""
+        chave = ('graficos', periodo, versao_graficos(categorias, meses), self.tamanho_graficos, self.dpi_exportacao, formato)
         
-        # Adicionar botão para salvar gráficos
-        ttk.Button(
-            self.graph_frame, text="Salvar Gráficos", style='Primary.TButton',
-            command=lambda: self.salvar_graficos(fig)
-        ).pack(pady=5)
+        def renderizar():
+            fig = self.desenhar_graficos(categorias, meses)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=formato, dpi=self.dpi_exportacao, bbox_inches='tight')
+            plt.close(fig)
+            imagem = buffer.getvalue()
+            return imagem, len(imagem)
+        
+        with self.instrumentacao.medir('renderizar_graficos'):
+            return self.cache_imagens.obter_ou_criar(chave, renderizar)
     
-    def salvar_graficos(self, fig):
+    def salvar_graficos(self):
         """Salva os gráficos em um arquivo de imagem"""
         filepath = filedialog.asksaveasfilename(
             defaultextension=".png",
@@ -811,15 +3405,65 @@ class GerenciadorGastosGUI:
         
         if filepath:
             try:
-                fig.savefig(filepath, dpi=300, bbox_inches='tight')
+                periodo, categorias, meses, _ = self.graficos_exibidos
+                formato = 'jpeg' if filepath.lower().endswith(('.jpg', '.jpeg')) else 'png'
+                with open(filepath, 'wb') as f:
+                    f.write(self.renderizar_graficos(periodo, categorias, meses, formato))
                 messagebox.showinfo("Sucesso", f"Gráficos salvos com sucesso em:\n{filepath}")
             except Exception as e:
                 messagebox.showerror("Erro", f"Falha ao salvar gráficos:\n{str(e)}")
     
+    @instrumentado
+    def exportar_graficos_lote(self):
+        """Exporta os gráficos de cada mês do histórico numa pasta, pulando os que não mudaram"""
+        pasta = filedialog.askdirectory(title="Pasta para os Gráficos")
+        if not pasta:
+            return
+        
+        # Uma única passada: os totais por mês e categoria vêm do cubo de agregados
+        self.garantir_particoes()
+        por_mes = defaultdict(dict)
+        for (ano, mes, categoria), (soma, _, _) in self.cubo_lancamentos.consultar(
+                ('ano', 'mes', 'categoria'), {'tipo': 'despesa'}).items():
+            por_mes[f"{mes}/{ano}"][categoria] = soma
+        
+        # O manifesto guarda a versão dos dados de cada arquivo já exportado
+        caminho_manifesto = os.path.join(pasta, '.graficos.json')
+        manifesto = {}
+        if os.path.exists(caminho_manifesto):
+            try:
+                with open(caminho_manifesto, 'r', encoding='utf-8') as f:
+                    manifesto = json.load(f)
+            except (OSError, ValueError):
+                manifesto = {}
+        
+        gerados = 0
+        try:
+            for periodo, categorias in sorted(por_mes.items(), key=lambda x: x[0][3:] + x[0][:2]):
+                meses = {periodo: sum(categorias.values())}
+                nome = f"graficos_{periodo[3:]}-{periodo[:2]}.png"
+                versao = f"{versao_graficos(categorias, meses)}@{self.dpi_exportacao}"
+                caminho = os.path.join(pasta, nome)
+                if manifesto.get(nome) == versao and os.path.exists(caminho):
+                    continue
+                with open(caminho, 'wb') as f:
+                    f.write(self.renderizar_graficos(periodo, categorias, meses))
+                manifesto[nome] = versao
+                gerados += 1
+                self.instrumentacao.registrar_linhas(1)
+        finally:
+            gravar_json_atomico(caminho_manifesto, manifesto, indent=2)
+        
+        messagebox.showinfo(
+            "Sucesso",
+            f"{gerados} gráfico(s) gerado(s); {len(por_mes) - gerados} já estavam atualizados em:\n{pasta}"
+        )
+    
     def verificar_limite_categoria(self, categoria):
         """Verifica se o limite da categoria foi excedido"""
         if categoria in self.limites_categoria:
-            gasto_categoria = sum(g['valor'] for g in self.gastos if g['categoria'].lower() == categoria.lower())
+            gasto_categoria = sum(valor for nome, valor in self.agregados_historico()['categorias'].items()
+                                  if nome.lower() == categoria.lower())
             limite = self.limites_categoria[categoria]
             
             if gasto_categoria > limite:
@@ -833,12 +3477,14 @@ class GerenciadorGastosGUI:
         alert_window.geometry("400x200")
         alert_window.resizable(False, False)
         
-        # Ícone de alerta
+        # Ícone de alerta (decodificado e redimensionado uma vez, enquanto o arquivo não mudar)
         try:
-            icon = Image.open("alert_icon.png") if os.path.exists("alert_icon.png") else None
-            if icon:
-                icon = icon.resize((64, 64), Image.LANCZOS)
-                icon = ImageTk.PhotoImage(icon)
+            assinatura = assinatura_arquivo("alert_icon.png")
+            if assinatura:
+                def carregar_icone():
+                    imagem = Image.open("alert_icon.png").resize((64, 64), Image.LANCZOS)
+                    return ImageTk.PhotoImage(imagem), 64 * 64 * 4
+                icon = self.cache_imagens.obter_ou_criar(('icone', "alert_icon.png", assinatura, (64, 64)), carregar_icone)
                 icon_label = tk.Label(alert_window, image=icon)
                 icon_label.image = icon
                 icon_label.pack(pady=10)
@@ -848,9 +3494,9 @@ class GerenciadorGastosGUI:
         # Mensagem
         msg = (
             f"Você ultrapassou o limite para {categoria}!\n\n"
-            f"Limite definido: R$ {limite:,.2f}\n"
-            f"Total gasto: R$ {gasto:,.2f}\n\n"
-            f"Diferença: R$ {gasto - limite:,.2f}"
+            f"Limite definido: {formatar_brl(limite)}\n"
+            f"Total gasto: {formatar_brl(gasto)}\n\n"
+            f"Diferença: {formatar_brl(gasto - limite)}"
         )
         
         ttk.Label(alert_window, text=msg, justify=tk.CENTER, font=('Arial', 10)).pack(pady=5)
@@ -861,155 +3507,561 @@ class GerenciadorGastosGUI:
         alert_window.grab_set()
         self.root.wait_window(alert_window)
     
+    def iterar_lancamentos(self):
+        """Percorre todos os lançamentos da carteira, lendo do disco as partições não carregadas sem mantê-las na memória"""
+        yield from self.gastos
+        for ano in sorted(set(self.particoes) - self.particoes_carregadas):
+            with open(self.caminho_particao(ano), 'r', encoding='utf-8') as f:
+                particao = json.load(f)
+            gastos = particao.get('gastos', [])
+            if particao.get('unidade') != 'centavos':
+                converter_lancamentos_reais(gastos)
+            yield from gastos
+    
+    def exportar_lancamentos(self, lancamentos, titulo, extras=None, formato_padrao=".json"):
+        """Pede o destino e grava os lançamentos no formato escolhido pela extensão"""
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=formato_padrao,
+            filetypes=FORMATOS_EXPORTACAO,
+            title=titulo
+        )
+        
+        if filepath:
+            try:
+                quantidade = gravar_exportacao(filepath, lancamentos, extras if formato_arquivo(filepath) == '.json' else None)
+                self.instrumentacao.registrar_linhas(quantidade)
+                messagebox.showinfo("Sucesso", f"{quantidade} lançamento(s) exportado(s) com sucesso para:\n{filepath}")
+            except Exception as e:
+                messagebox.showerror("Erro", f"Falha ao exportar dados:\n{str(e)}")
+    
+    @instrumentado
     def exportar_selecao(self):
-        """Exporta os gastos selecionados para CSV"""
+        """Exporta os gastos selecionados para CSV, JSON Lines ou JSON"""
         selecionados = self.tree.selection()
         if not selecionados:
             messagebox.showwarning("Aviso", "Selecione um ou mais gastos para exportar!")
             return
             
-        gastos_selecionados = []
-        for item in selecionados:
-            values = self.tree.item(item)['values']
-            gasto = {
-                'id': values[0],
-                'data': datetime.strptime(values[1], '%d/%m/%Y').strftime('%Y-%m-%d'),
-                'valor': float(values[2].replace('.', '').replace(',', '.')),
-                'categoria': values[3],
-                'descricao': values[4]
-            }
-            gastos_selecionados.append(gasto)
+        # Os registros vêm dos próprios lançamentos, pelo id guardado no iid da linha
+        ids_selecionados = {int(item) for item in selecionados if 'projetado' not in self.tree.item(item)['tags']}
+        gastos_selecionados = [g for g in self.gastos if g['id'] in ids_selecionados]
+        if not gastos_selecionados:
+            messagebox.showwarning("Aviso", "Lançamentos previstos não podem ser exportados!")
+            return
         
-        filepath = filedialog.asksaveasfilename(
-            defaultextension=".csv",
-            filetypes=[("CSV File", "*.csv"), ("All Files", "*.*")],
-            title="Salvar Gastos Selecionados Como"
-        )
+        self.exportar_lancamentos(gastos_selecionados, "Salvar Gastos Selecionados Como", formato_padrao=".csv")
+    
+    @instrumentado
+    def exportar_visualizacao(self):
+        """Exporta os lançamentos da visualização atual (filtrada ou completa)"""
+        if self.lancamentos_exibidos is None:
+            self.exportar_dados()
+            return
         
-        if filepath:
-            try:
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write("ID,Data,Valor,Categoria,Descrição\n")
-                    for g in gastos_selecionados:
-                        f.write(f"{g['id']},{g['data']},{g['valor']:.2f},{g['categoria']},{g['descricao']}\n")
-                messagebox.showinfo("Sucesso", f"Dados exportados com sucesso para:\n{filepath}")
-            except Exception as e:
-                messagebox.showerror("Erro", f"Falha ao exportar dados:\n{str(e)}")
+        # Previstos não são lançamentos reais e ficam de fora
+        lancamentos = (g for g in self.lancamentos_exibidos if not g.get('projetado'))
+        self.exportar_lancamentos(lancamentos, "Exportar Visualização Como", formato_padrao=".csv")
     
+    @instrumentado
     def exportar_dados(self):
-        """Exporta todos os dados para arquivo JSON ou CSV"""
-        filepath = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON File", "*.json"), ("CSV File", "*.csv"), ("All Files", "*.*")],
-            title="Exportar Dados Como"
+        """Exporta todos os dados para JSON, JSON Lines ou CSV, opcionalmente comprimidos"""
+        extras = {
+            'limites': self.limites_categoria,
+            'categorias': self.categorias_predefinidas,
+            'recorrencias': self.recorrencias
+        }
+        self.exportar_lancamentos(self.iterar_lancamentos(), "Exportar Dados Como", extras)
+    
+    @instrumentado
+    def importar_dados(self):
+        """Importa dados de um ou mais arquivos JSON ou CSV"""
+        if self.importacao_em_andamento:
+            messagebox.showwarning("Aviso", "Aguarde o término da importação em andamento")
+            return
+        
+        filepaths = filedialog.askopenfilenames(
+            filetypes=FORMATOS_EXPORTACAO,
+            title="Selecionar Arquivos para Importar"
         )
         
-        if filepath:
+        if not filepaths:
+            return
+        
+        # Ordem fixa para que a mesclagem (e os ids atribuídos) não dependa da ordem de término
+        arquivos = sorted(filepaths)
+        
+        if len(arquivos) == 1:
             try:
-                if filepath.endswith('.json'):
-                    dados = {
-                        'gastos': self.gastos,
-                        'limites': self.limites_categoria,
-                        'categorias': self.categorias_predefinidas
-                    }
-                    with open(filepath, 'w', encoding='utf-8') as f:
-                        json.dump(dados, f, indent=2, ensure_ascii=False)
-                elif filepath.endswith('.csv'):
-                    with open(filepath, 'w', encoding='utf-8') as f:
-                        f.write("ID,Data,Valor,Categoria,Descrição\n")
-                        for g in self.gastos:
-                            data_formatada = datetime.strptime(g['data'], '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d')
-                            f.write(f"{g['id']},{data_formatada},{g['valor']:.2f},{g['categoria']},{g['descricao']}\n")
-                
-                messagebox.showinfo("Sucesso", f"Dados exportados com sucesso para:\n{filepath}")
+                self.mesclar_importacao(arquivos, [ler_arquivo_importacao(arquivos[0])])
             except Exception as e:
-                messagebox.showerror("Erro", f"Falha ao exportar dados:\n{str(e)}")
+                messagebox.showerror("Erro", f"Falha ao importar dados:\n{str(e)}")
+            return
+        
+        # Vários arquivos: a leitura e normalização são distribuídas entre processos
+        executor = ProcessPoolExecutor(max_workers=min(len(arquivos), self.max_processos_importacao))
+        futuros = [executor.submit(ler_arquivo_importacao, caminho) for caminho in arquivos]
+        self.importacao_em_andamento = (executor, arquivos, futuros)
+        self.root.config(cursor='watch')
+        self.acompanhar_importacao()
     
-    def importar_dados(self):
-        """Importa dados de arquivo JSON ou CSV"""
-        filepath = filedialog.askopenfilename(
-            filetypes=[("JSON File", "*.json"), ("CSV File", "*.csv"), ("All Files", "*.*")],
-            title="Selecionar Arquivo para Importar"
-        )
+    def acompanhar_importacao(self):
+        """Aguarda, sem bloquear a interface, a leitura paralela dos arquivos e então mescla"""
+        executor, arquivos, futuros = self.importacao_em_andamento
+        if not all(f.done() for f in futuros):
+            self.root.after(100, self.acompanhar_importacao)
+            return
         
-        if filepath:
+        executor.shutdown(wait=False)
+        self.importacao_em_andamento = None
+        self.root.config(cursor='')
+        
+        lidos = []
+        lidos_arquivos = []
+        erros = []
+        for caminho, futuro in zip(arquivos, futuros):
             try:
-                if filepath.endswith('.json'):
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        dados = json.load(f)
-                        
-                    if isinstance(dados, dict):  # Formato novo
-                        novos_gastos = dados.get('gastos', [])
-                        novos_limites = dados.get('limites', {})
-                        novas_categorias = dados.get('categorias', [])
-                    else:  # Formato antigo
-                        novos_gastos = dados
-                        novos_limites = {}
-                        novas_categorias = []
-                    
-                    # Atualizar dados
-                    self.gastos.extend(novos_gastos)
-                    self.limites_categoria.update(novos_limites)
-                    self.categorias_predefinidas = list(set(self.categorias_predefinidas + novas_categorias))
-                    self.categorias_predefinidas.sort()
-                    self.categoria_combobox['values'] = self.categorias_predefinidas
-                    
-                    # Atribuir IDs aos novos gastos
-                    max_id = max([g['id'] for g in self.gastos] + [0])
-                    for i, gasto in enumerate(novos_gastos):
-                        if 'id' not in gasto:
-                            max_id += 1
-                            gasto['id'] = max_id
-                
-                elif filepath.endswith('.csv'):
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        linhas = f.readlines()
-                    
-                    novos_gastos = []
-                    max_id = max([g['id'] for g in self.gastos] + [0])
-                    
-                    for linha in linhas[1:]:  # Pular cabeçalho
-                        campos = linha.strip().split(',')
-                        if len(campos) >= 5:
-                            max_id += 1
-                            novo_gasto = {
-                                'id': max_id,
-                                'data': datetime.strptime(campos[1], '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S'),
-                                'valor': float(campos[2]),
-                                'categoria': campos[3],
-                                'descricao': campos[4]
-                            }
-                            novos_gastos.append(novo_gasto)
-                    
-                    self.gastos.extend(novos_gastos)
-                
-                self.salvar_dados()
-                self.atualizar_lista_gastos()
-                self.atualizar_estatisticas()
-                messagebox.showinfo("Sucesso", f"Dados importados com sucesso!\n{len(novos_gastos)} novos gastos adicionados.")
-            
+                lidos.append(futuro.result())
+                lidos_arquivos.append(caminho)
+            except Exception as e:
+                erros.append(f"{os.path.basename(caminho)}: {str(e)}")
+        
+        if erros:
+            messagebox.showerror("Erro", "Falha ao importar arquivo(s):\n" + "\n".join(erros))
+        if lidos:
+            try:
+                self.mesclar_importacao(lidos_arquivos, lidos)
             except Exception as e:
                 messagebox.showerror("Erro", f"Falha ao importar dados:\n{str(e)}")
     
+    @instrumentado
+    def mesclar_importacao(self, arquivos, lidos):
+        """Mescla os lançamentos lidos sem duplicar os que já existem, com um único salvamento"""
+        importados = [g for lido in lidos for g in lido['gastos']]
+        
+        # Só as partições ao alcance da janela de comparação precisam estar carregadas
+        anos = set()
+        for g in importados:
+            data = datetime.strptime(g['data'][:10], '%Y-%m-%d')
+            for deslocamento in (-self.janela_duplicados_dias, 0, self.janela_duplicados_dias):
+                anos.add((data + timedelta(days=deslocamento)).strftime('%Y'))
+        self.garantir_particoes(anos)
+        
+        # Arquivo a arquivo, na ordem ordenada: extratos sobrepostos do mesmo lote não duplicam entre si
+        relatorio = deduplicar_lancamentos(
+            self.gastos, [lido['gastos'] for lido in lidos], self.janela_duplicados_dias, self.limiar_similaridade
+        )
+        
+        incluir_suspeitos = False
+        if relatorio['suspeitos']:
+            resposta = messagebox.askyesnocancel(
+                "Possíveis Duplicados",
+                f"{len(relatorio['novos'])} novo(s), {len(relatorio['duplicados'])} duplicado(s) exato(s) "
+                f"e {len(relatorio['suspeitos'])} possível(is) duplicado(s) encontrados.\n\n"
+                "Importar também os possíveis duplicados?\n"
+                "(Sim = importar, Não = ignorar, Cancelar = desistir da importação)"
+            )
+            if resposta is None:
+                return
+            incluir_suspeitos = resposta
+        
+        novos_gastos = relatorio['novos'] + ([s[0] for s in relatorio['suspeitos']] if incluir_suspeitos else [])
+        proximo_id = self.proximo_id()
+        for gasto in novos_gastos:
+            gasto['id'] = proximo_id
+            proximo_id += 1
+        
+        # Atualizar dados
+        self.incluir_lancamentos(novos_gastos)
+        for lido in lidos:
+            self.limites_categoria.update(lido['limites'])
+            self.categorias_predefinidas = list(set(self.categorias_predefinidas + lido['categorias']))
+        self.categorias_predefinidas = sorted(set(
+            self.categorias_predefinidas + [c for g in novos_gastos for c, _ in partes_lancamento(g)]
+        ))
+        self.categoria_combobox['values'] = self.categorias_predefinidas
+        
+        self.instrumentacao.registrar_linhas(len(importados))
+        self.salvar_dados()
+        self.atualizar_lista_gastos()
+        self.atualizar_estatisticas()
+        self.mostrar_relatorio_importacao(arquivos, relatorio, incluir_suspeitos)
+    
+    def mostrar_relatorio_importacao(self, arquivos, relatorio, incluir_suspeitos):
+        """Mostra o relatório da mesclagem: novos, duplicados e possíveis duplicados"""
+        relatorio_window = tk.Toplevel(self.root)
+        relatorio_window.title("Relatório de Importação")
+        relatorio_window.geometry("600x400")
+        relatorio_window.transient(self.root)
+        
+        texto = "=== RELATÓRIO DE IMPORTAÇÃO ===\n\n"
+        texto += "Arquivo(s): " + ", ".join(os.path.basename(a) for a in arquivos) + "\n"
+        texto += f"Novos lançamentos importados: {len(relatorio['novos'])}\n"
+        texto += f"Duplicados exatos ignorados: {len(relatorio['duplicados'])}\n"
+        texto += (
+            f"Possíveis duplicados: {len(relatorio['suspeitos'])} "
+            f"({'importados' if incluir_suspeitos else 'ignorados'})\n"
+        )
+        
+        if relatorio['suspeitos']:
+            texto += "\n=== POSSÍVEIS DUPLICADOS ===\n\n"
+            for novo, existente, similaridade in relatorio['suspeitos']:
+                texto += (
+                    f"{datetime.strptime(novo['data'][:10], '%Y-%m-%d').strftime('%d/%m/%Y')} "
+                    f"{formatar_brl(novo['valor'])} \"{novo.get('descricao', '')}\"\n"
+                    f"  ≈ #{existente['id']} "
+                    f"{datetime.strptime(existente['data'][:10], '%Y-%m-%d').strftime('%d/%m/%Y')} "
+                    f"\"{existente.get('descricao', '')}\" ({similaridade:.0%})\n"
+                )
+        
+        relatorio_text = tk.Text(relatorio_window, wrap=tk.WORD, font=('Arial', 10))
+        relatorio_text.insert(tk.END, texto)
+        relatorio_text.config(state=tk.DISABLED)
+        relatorio_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        ttk.Button(relatorio_window, text="Fechar", command=relatorio_window.destroy).pack(pady=5)
+    
     def criar_backup_manual(self):
         """Cria um backup manual dos dados"""
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = os.path.join(self.backup_dir, f'gastos_backup_manual_{timestamp}.json')
+            backup_path = os.path.join(self.backup_dir, f'{self.prefixo_backup()}manual_{timestamp}.json')
             
+            # O backup manual é completo, incluindo as partições ainda não carregadas
+            self.garantir_particoes()
             dados = {
+                'unidade': 'centavos',
                 'gastos': self.gastos,
                 'limites': self.limites_categoria,
-                'categorias': self.categorias_predefinidas
+                'categorias': self.categorias_predefinidas,
+                'recorrencias': self.recorrencias
             }
             
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(dados, f, indent=2, ensure_ascii=False)
+            gravar_json_atomico(backup_path, dados, indent=2, ensure_ascii=False)
             
             messagebox.showinfo("Sucesso", f"Backup criado com sucesso em:\n{backup_path}")
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao criar backup:\n{str(e)}")
     
+    def mostrar_diagnostico(self):
+        """Mostra latências das ações da interface e controles de perfilamento"""
+        diag_window = tk.Toplevel(self.root)
+        diag_window.title("Diagnóstico de Desempenho")
+        diag_window.geometry("700x650")
+        
+        diag_frame = ttk.Frame(diag_window, padding=10)
+        diag_frame.pack(fill=tk.BOTH, expand=True)
+        
+        columns = ('acao', 'chamadas', 'p50', 'p95', 'maximo', 'linhas')
+        diag_tree = ttk.Treeview(diag_frame, columns=columns, show='headings', height=15)
+        for coluna, titulo, largura in [
+            ('acao', 'Ação', 200), ('chamadas', 'Chamadas', 80), ('p50', 'p50 (ms)', 80),
+            ('p95', 'p95 (ms)', 80), ('maximo', 'Máx. (ms)', 80), ('linhas', 'Linhas', 90)
+        ]:
+            diag_tree.heading(coluna, text=titulo)
+            diag_tree.column(coluna, width=largura, anchor='w' if coluna == 'acao' else 'e')
+        diag_tree.pack(fill=tk.BOTH, expand=True, pady=5)
+        
+        # Uso de memória por estrutura
+        memoria_var = tk.StringVar()
+        ttk.Label(diag_frame, textvariable=memoria_var, font=('Arial', 10, 'bold')).pack(anchor=tk.W, pady=(10, 0))
+        memoria_tree = ttk.Treeview(diag_frame, columns=('estrutura', 'tamanho', 'percentual'), show='headings', height=8)
+        for coluna, titulo, largura in [('estrutura', 'Estrutura', 300), ('tamanho', 'Tamanho (MB)', 120), ('percentual', '%', 80)]:
+            memoria_tree.heading(coluna, text=titulo)
+            memoria_tree.column(coluna, width=largura, anchor='w' if coluna == 'estrutura' else 'e')
+        memoria_tree.pack(fill=tk.X, pady=5)
+        
+        def atualizar():
+            for item in diag_tree.get_children():
+                diag_tree.delete(item)
+            for nome, chamadas, p50, p95, maximo, linhas in self.instrumentacao.resumo():
+                diag_tree.insert('', tk.END, values=(
+                    nome, chamadas, f"{p50 * 1000:.1f}", f"{p95 * 1000:.1f}", f"{maximo * 1000:.1f}", linhas
+                ))
+            
+            uso = self.uso_memoria()
+            total = sum(uso.values()) or 1
+            orcamento = f"{self.orcamento_memoria_mb} MB" if self.orcamento_memoria_mb else "sem limite"
+            memoria_var.set(f"Memória estimada: {total / 1048576:.1f} MB (orçamento: {orcamento})")
+            for item in memoria_tree.get_children():
+                memoria_tree.delete(item)
+            for nome, tamanho in sorted(uso.items(), key=lambda x: x[1], reverse=True):
+                memoria_tree.insert('', tk.END, values=(nome, f"{tamanho / 1048576:.2f}", f"{100 * tamanho / total:.1f}"))
+        
+        def alternar_perfil():
+            if self.instrumentacao.perfilador is None:
+                self.instrumentacao.iniciar_perfil()
+                perfil_btn.config(text="Parar Captura cProfile")
+                return
+            
+            filepath = filedialog.asksaveasfilename(
+                defaultextension=".prof",
+                filetypes=[("cProfile Stats", "*.prof"), ("All Files", "*.*")],
+                title="Salvar Perfil Como", parent=diag_window
+            )
+            if filepath:
+                try:
+                    self.instrumentacao.parar_perfil(filepath)
+                    perfil_btn.config(text="Iniciar Captura cProfile")
+                    messagebox.showinfo("Sucesso", f"Perfil salvo em:\n{filepath}", parent=diag_window)
+                except Exception as e:
+                    messagebox.showerror("Erro", f"Falha ao salvar perfil:\n{str(e)}", parent=diag_window)
+        
+        def exportar_trace():
+            filepath = filedialog.asksaveasfilename(
+                defaultextension=".json",
+                filetypes=[("Chrome Trace", "*.json"), ("All Files", "*.*")],
+                title="Exportar Trace Como", parent=diag_window
+            )
+            if filepath:
+                try:
+                    self.instrumentacao.exportar_trace(filepath)
+                    messagebox.showinfo("Sucesso", f"Trace exportado para:\n{filepath}", parent=diag_window)
+                except Exception as e:
+                    messagebox.showerror("Erro", f"Falha ao exportar trace:\n{str(e)}", parent=diag_window)
+        
+        btn_frame = ttk.Frame(diag_frame)
+        btn_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Button(btn_frame, text="Atualizar", style='Primary.TButton', command=atualizar).pack(side=tk.LEFT, padx=5)
+        perfil_btn = ttk.Button(
+            btn_frame, style='Secondary.TButton', command=alternar_perfil,
+            text="Parar Captura cProfile" if self.instrumentacao.perfilador else "Iniciar Captura cProfile"
+        )
+        perfil_btn.pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Exportar Trace", style='Secondary.TButton', command=exportar_trace).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Fechar", command=diag_window.destroy).pack(side=tk.RIGHT, padx=5)
+        
+        atualizar()
+    
+    def alternar_servidor_api(self):
+        """Liga ou desliga o servidor HTTP/JSON local sobre a carteira ativa"""
+        if self.servidor_api_var.get():
+            try:
+                self.servidor_api = ThreadingHTTPServer(self.endereco_api, ManipuladorAPI)
+            except OSError as e:
+                self.servidor_api_var.set(False)
+                messagebox.showerror("Erro", f"Não foi possível iniciar o servidor de API:\n{str(e)}")
+                return
+            self.servidor_api.daemon_threads = True
+            self.servidor_api.app = self
+            self.servidor_api.token = secrets.token_urlsafe(24)  # Novo a cada vez que o servidor é ligado
+            threading.Thread(target=self.servidor_api.serve_forever, daemon=True).start()
+            self.processar_fila_interface()
+            self.root.clipboard_clear()
+            self.root.clipboard_append(self.servidor_api.token)
+            messagebox.showinfo(
+                "API",
+                f"Servidor de API disponível em http://{self.endereco_api[0]}:{self.endereco_api[1]}/\n\n"
+                f"Token desta sessão (copiado para a área de transferência):\n{self.servidor_api.token}\n\n"
+                "Envie-o no cabeçalho Authorization: Bearer <token>."
+            )
+        elif self.servidor_api:
+            servidor, self.servidor_api = self.servidor_api, None
+            threading.Thread(target=servidor.shutdown, daemon=True).start()
+            servidor.server_close()
+    
+    def processar_fila_interface(self):
+        """Executa na thread do Tk as operações enviadas pela API"""
+        while True:
+            try:
+                funcao, args, pronto, resultado, reserva = self.fila_interface.get_nowait()
+            except queue.Empty:
+                break
+            if not reserva.acquire(blocking=False):
+                continue  # Cancelada por tempo esgotado: o cliente já recebeu 503
+            try:
+                resultado['valor'] = funcao(*args)
+            except Exception as e:
+                resultado['erro'] = e
+            pronto.set()
+        
+        if self.servidor_api:
+            self.root.after(50, self.processar_fila_interface)
+    
+    def executar_na_interface(self, funcao, *args, tempo_limite=30):
+        """Chamado pela API: agenda a função na thread do Tk e aguarda o resultado"""
+        pronto = threading.Event()
+        resultado = {}
+        reserva = threading.Lock()  # Quem a obtiver primeiro decide: a interface executa ou a API cancela
+        self.fila_interface.put((funcao, args, pronto, resultado, reserva))
+        if not pronto.wait(tempo_limite):
+            if reserva.acquire(blocking=False):
+                # Ainda não começou e agora nunca vai começar: repetir a requisição não duplica nada
+                raise ErroAPI(503, "A interface não respondeu a tempo")
+            pronto.wait()  # Já em execução: o resultado é o desta requisição
+        if 'erro' in resultado:
+            raise resultado['erro']
+        return resultado['valor']
+    
+    @staticmethod
+    def ler_dados_api(dados, atual=None):
+        """Valida os campos de um lançamento recebido pela API (atual = valores padrão na edição)"""
+        atual = atual or {'data': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'descricao': '', 'tipo': 'despesa'}
+        # Só inteiros: aceitar float ou texto faria a unidade depender do tipo JSON (12 vs 12.0)
+        valor = dados.get('valor', atual.get('valor'))
+        if not isinstance(valor, int) or isinstance(valor, bool):
+            raise ErroAPI(400, "valor deve ser um número inteiro de centavos (ex.: 1250 para R$ 12,50)")
+        try:
+            data = dados.get('data')
+            data = datetime.strptime(data[:10], '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S') if data else atual['data']
+        except (TypeError, ValueError):
+            raise ErroAPI(400, "Data inválida (use AAAA-MM-DD)")
+        
+        tags = dados.get('tags', atual.get('tags', []))
+        divisoes = dados.get('divisoes', atual.get('divisoes')) or []
+        if not isinstance(tags, list) or not isinstance(divisoes, list) or not all(isinstance(d, dict) for d in divisoes):
+            raise ErroAPI(400, "tags deve ser uma lista de textos e divisoes uma lista de {categoria, valor}")
+        try:
+            divisoes = normalizar_divisoes(divisoes, valor) if divisoes else []
+        except ValueError as e:
+            raise ErroAPI(400, str(e))
+        
+        categoria = str(dados.get('categoria', atual.get('categoria', ''))).strip()
+        tipo = dados.get('tipo', atual.get('tipo', 'despesa'))
+        if valor <= 0 or not (categoria or divisoes) or tipo not in ('despesa', 'receita'):
+            raise ErroAPI(400, "Informe valor positivo, categoria e tipo 'despesa' ou 'receita'")
+        return (valor, categoria, data, str(dados.get('descricao', atual['descricao'])).strip(), tipo,
+                interpretar_tags(tags), divisoes)
+    
+    def localizar_lancamento(self, id_lancamento):
+        """Encontra o lançamento pelo id, carregando o histórico se necessário (thread da interface)"""
+        for carregar in (False, True):
+            if carregar:
+                self.garantir_particoes()
+            for g in self.gastos:
+                if g['id'] == id_lancamento:
+                    return g
+        raise ErroAPI(404, f"Lançamento {id_lancamento} não encontrado")
+    
+    def api_atualizar_interface(self):
+        """Reflete na janela uma alteração feita pela API"""
+        self.salvar_dados()
+        self.atualizar_lista_gastos()
+        self.atualizar_estatisticas()
+    
+    def api_adicionar(self, dados):
+        valor, categoria, data, descricao, tipo, tags, divisoes = self.ler_dados_api(dados)
+        gasto = {
+            'id': self.proximo_id(),
+            'data': data,
+            'valor': valor,
+            'categoria': categoria,
+            'descricao': descricao,
+            'tipo': tipo
+        }
+        classificar_lancamento(gasto, tags, divisoes)
+        self.incluir_lancamentos([gasto])
+        self.api_atualizar_interface()
+        return dict(gasto)
+    
+    def api_editar(self, id_lancamento, dados):
+        gasto = self.localizar_lancamento(id_lancamento)
+        self.alterar_lancamento(gasto, *self.ler_dados_api(dados, gasto))
+        self.api_atualizar_interface()
+        return dict(gasto)
+    
+    def api_remover(self, id_lancamento):
+        gasto = self.localizar_lancamento(id_lancamento)
+        self.excluir_lancamentos([id_lancamento])
+        self.api_atualizar_interface()
+        return dict(gasto)
+    
+    def api_obter(self, id_lancamento):
+        with self.trava_dados.leitura():
+            for g in self.gastos:
+                if g['id'] == id_lancamento:
+                    return dict(g)
+        # Pode estar numa partição ainda não carregada
+        return dict(self.executar_na_interface(self.localizar_lancamento, id_lancamento))
+    
+    def api_listar(self, parametros):
+        """Lançamentos filtrados por inicio/fim (AAAA-MM-DD), categoria, tipo e tags, do mais recente ao mais antigo"""
+        inicio, fim = parametros.get('inicio', ''), parametros.get('fim', '')
+        try:
+            for data in (inicio, fim):
+                if data:
+                    datetime.strptime(data, '%Y-%m-%d')
+        except ValueError:
+            raise ErroAPI(400, "Datas devem estar no formato AAAA-MM-DD")
+        
+        # Só as partições do período pedido precisam estar carregadas, e reservadas até a leitura
+        with self.trava_dados.leitura():
+            anos = {a for a in self.particoes if (not inicio or a >= inicio[:4]) and (not fim or a <= fim[:4])}
+        self.reservar_particoes(anos)
+        try:
+            with self.trava_dados.leitura():
+                faltando = anos - self.particoes_carregadas
+            if faltando:
+                self.executar_na_interface(self.garantir_particoes, faltando)
+            
+            fim = fim and fim + ' 99'  # Inclui o dia final inteiro
+            categoria = parametros.get('categoria', '').lower()
+            tipo = parametros.get('tipo')
+            # tags=a,b exige todas; alguma_tag=a,b exige ao menos uma; sem_tags=a,b exclui
+            consulta_tags = [interpretar_tags(parametros.get(nome, '')) for nome in ('tags', 'alguma_tag', 'sem_tags')]
+            with self.trava_dados.leitura():
+                ids_tags = self.indice_tags.ids(self.indice_tags.consultar(*consulta_tags)) if any(consulta_tags) else None
+                lancamentos = [
+                    dict(g) for g in self.gastos
+                    if (not inicio or g['data'] >= inicio) and (not fim or g['data'] <= fim)
+                    and (ids_tags is None or g['id'] in ids_tags)
+                    and (not categoria or any(c.lower() == categoria for c, _ in partes_lancamento(g)))
+                    and (not tipo or g.get('tipo', 'despesa') == tipo)
+                ]
+        finally:
+            self.liberar_reserva_particoes(anos)
+        self.instrumentacao.registrar_linhas(len(lancamentos))
+        return sorted(lancamentos, key=lambda g: g['data'], reverse=True)
+    
+    def api_resumo(self):
+        """Totais do histórico, saldo, fluxo do mês e previsões por categoria"""
+        hoje = datetime.now()
+        # Tudo sob a mesma leitura: uma troca de carteira não mistura nome, totais e limites
+        with self.trava_dados.leitura():
+            agregados = self.agregados_historico()
+            return {
+                'carteira': self.carteira_ativa,
+                'unidade': 'centavos',
+                'quantidade': agregados['quantidade'],
+                'total_despesas': agregados['total'],
+                'total_receitas': agregados['receitas'],
+                'saldo': self.indice_saldo.saldo_ate(hoje) + self.deslocamento_saldo(hoje.strftime('%Y')),
+                'fluxo_mes': self.indice_saldo.fluxo(hoje.replace(day=1), hoje),
+                'categorias': dict(agregados['categorias']),
+                'tags': dict(agregados['tags']),
+                'meses': dict(sorted(agregados['meses'].items())),
+                'maior': agregados['maior'],
+                'previsoes': self.motor_analitico.previsoes(hoje),
+                'limites': dict(self.limites_categoria)
+            }
+    
+    def api_graficos(self, parametros):
+        """Dados agregados para gráficos: dimensoes=categoria,mes,... e tipo=despesa|receita|todos"""
+        dimensoes = [d for d in parametros.get('dimensoes', 'categoria').split(',') if d]
+        if any(d not in DIMENSOES_RELATORIO for d in dimensoes):
+            raise ErroAPI(400, f"Dimensões válidas: {', '.join(DIMENSOES_RELATORIO)}")
+        tipo = parametros.get('tipo', 'despesa')
+        filtro = None if tipo == 'todos' else {'tipo': tipo}
+        
+        # Todo o histórico fica reservado até a leitura do cubo
+        with self.trava_dados.leitura():
+            anos = set(self.particoes)
+        self.reservar_particoes(anos)
+        try:
+            with self.trava_dados.leitura():
+                faltando = anos - self.particoes_carregadas
+            if faltando:
+                self.executar_na_interface(self.garantir_particoes, faltando)
+            
+            with self.trava_dados.leitura():
+                cubo = self.cubo_lancamentos.consultar(dimensoes, filtro)
+                linhas = [
+                    dict(zip(dimensoes, chave), soma=soma, quantidade=quantidade, maximo=maximo)
+                    for chave, (soma, quantidade, maximo) in sorted(cubo.items())
+                ]
+        finally:
+            self.liberar_reserva_particoes(anos)
+        return {'dimensoes': dimensoes, 'unidade': 'centavos', 'linhas': linhas}
+    
     def alternar_tema(self):
         """Alterna entre tema claro e escuro"""
         self.theme = 'dark' if self.theme == 'light' else 'light'